@@ -6,6 +6,7 @@ from services.mpesa_parser import MPesaParser
 from services.enhanced_sms_parser import EnhancedSMSParser
 from services.duplicate_detector import DuplicateDetector
 from services.categorization import CategorizationService
+from services.frequency_analyzer import extract_description_pattern
 from typing import List, Dict, Any
 import uuid
 from datetime import datetime
@@ -158,7 +159,9 @@ async def import_sms_messages(
                         **transaction_create.dict()
                     )
 
-                    result = await db.transactions.insert_one(transaction.dict())
+                    transaction_doc = transaction.dict()
+                    transaction_doc['pattern'] = extract_description_pattern(transaction.description)
+                    result = await db.transactions.insert_one(transaction_doc)
                     transaction_id = str(result.inserted_id)
                     transaction.id = transaction_id
 
@@ -319,7 +322,9 @@ async def create_transaction_from_parsed_sms(
         )
         
         transaction = Transaction(**transaction_data.dict(), user_id=user_id)
-        result = await db.transactions.insert_one(transaction.dict())
+        transaction_doc = transaction.dict()
+        transaction_doc['pattern'] = extract_description_pattern(transaction.description)
+        result = await db.transactions.insert_one(transaction_doc)
         transaction.id = str(result.inserted_id)
         
         return transaction
@@ -359,8 +364,7 @@ async def test_parser_with_sample_messages():
     }
 
     # Test user examples
-    for message in user_examples:
-        parsed = MPesaParser.parse_message(message)
+    for message, parsed in zip(user_examples, MPesaParser.parse_messages(user_examples)):
         results["user_examples"].append({
             "original_message": message,
             "parsed_successfully": parsed is not None,
@@ -374,8 +378,7 @@ async def test_parser_with_sample_messages():
         })
 
     # Test legacy examples
-    for message in legacy_examples:
-        parsed = MPesaParser.parse_message(message)
+    for message, parsed in zip(legacy_examples, MPesaParser.parse_messages(legacy_examples)):
         results["legacy_examples"].append({
             "original_message": message,
             "parsed_successfully": parsed is not None,
@@ -412,9 +415,8 @@ async def test_user_specific_examples():
     ]
 
     results = []
-    for i, message in enumerate(user_examples, 1):
-        parsed = MPesaParser.parse_message(message)
-
+    parsed_messages = MPesaParser.parse_messages(user_examples)
+    for i, (message, parsed) in enumerate(zip(user_examples, parsed_messages), 1):
         # Detailed analysis for each message
         analysis = {
             "message_number": i,
@@ -3,7 +3,7 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 from models.transaction import Transaction, TransactionCreate, TransactionUpdate
 from models.user import Category
 from services.categorization import CategorizationService
-from services.frequency_analyzer import TransactionFrequencyAnalyzer, FrequentTransaction
+from services.frequency_analyzer import TransactionFrequencyAnalyzer, FrequentTransaction, extract_description_pattern
 from typing import List, Optional, Literal
 from datetime import datetime, timedelta
 from bson import ObjectId
@@ -83,8 +83,11 @@ async def create_transaction(transaction_data: TransactionCreate, db: AsyncIOMot
         transaction_dict['category_id'] = category_id
         transaction = Transaction(**transaction_dict)
 
-        print(f"Creating transaction: {transaction.dict()}")
-        result = await db.transactions.insert_one(transaction.dict())
+        transaction_doc = transaction.dict()
+        transaction_doc['pattern'] = extract_description_pattern(transaction.description)
+
+        print(f"Creating transaction: {transaction_doc}")
+        result = await db.transactions.insert_one(transaction_doc)
         transaction.id = str(result.inserted_id)
         print(f"Transaction created with ID: {transaction.id}")
 
@@ -126,6 +129,8 @@ async def update_transaction(transaction_id: str, update_data: TransactionUpdate
         
         # Prepare update data
         update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
+        if 'description' in update_dict:
+            update_dict['pattern'] = extract_description_pattern(update_dict['description'])
         
         if update_dict:
             await db.transactions.update_one(
@@ -720,12 +725,12 @@ async def debug_database(db: AsyncIOMotorDatabase = Depends(get_db)):
 
 class CategoryUpdateRequest(BaseModel):
     category_id: str
-    transaction_ids: List[str]
+    transaction_ids: Optional[List[str]] = None  # Only needed for transactions without a stored pattern
     pattern: str
 
 class PatternReviewRequest(BaseModel):
     pattern: str
-    transaction_ids: List[str]
+    transaction_ids: Optional[List[str]] = None  # Only needed for transactions without a stored pattern
     action: Literal["categorize", "dismiss"]
 
 @router.get("/frequency-analysis")
@@ -98,6 +98,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def prepare_transaction_patterns():
+    # Persisted description patterns back the frequency analysis
+    from services.frequency_analyzer import TransactionFrequencyAnalyzer
+    analyzer = TransactionFrequencyAnalyzer(db)
+    try:
+        await analyzer.ensure_pattern_index()
+        backfilled = await analyzer.backfill_patterns()
+        if backfilled:
+            logger.info(f"Backfilled description patterns on {backfilled} transactions")
+    except Exception as e:
+        logger.warning(f"Could not prepare transaction patterns: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
@@ -7,12 +7,18 @@ Ensures every shilling is accounted for by creating:
 - Fuliza deduction transactions (automatic repayments)
 """
 
+import re
 import uuid
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from models.transaction import TransactionCreate, MPesaDetails, SMSMetadata
 from services.mpesa_parser import MPesaParser
 
+# "Ksh X.XX has been used to pay/repay Fuliza" in compound received messages
+_RE_FULIZA_DEDUCTION = re.compile(
+    r'(?:ksh?|kes)\s*([0-9,]+(?:\.[0-9]{1,2})?)\s+.*?(?:used to|been used to).*?(?:pay|repay).*?fuliza'
+)
+
 
 class EnhancedSMSParser:
     """
@@ -222,9 +228,7 @@ class EnhancedSMSParser:
             return None
         
         # Pattern to find "Ksh X.XX has been used to pay/repay Fuliza"
-        import re
-        deduction_pattern = r'(?:ksh?|kes)\s*([0-9,]+(?:\.[0-9]{1,2})?)\s+.*?(?:used to|been used to).*?(?:pay|repay).*?fuliza'
-        match = re.search(deduction_pattern, message.lower())
+        match = _RE_FULIZA_DEDUCTION.search(message.lower())
         
         if match:
             amount_str = match.group(1).replace(',', '')
@@ -1,12 +1,86 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Any, AsyncIterable
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models.transaction import Transaction
+from pymongo import UpdateOne
 from models.user import Category
-from datetime import datetime, timedelta
+from services.categorization import CategorizationService
+from datetime import datetime, timedelta, timezone
 import re
-from collections import defaultdict
+import heapq
+import asyncio
+import numpy as np
+from collections import Counter
+from itertools import groupby
 from dataclasses import dataclass
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the kernel runs as plain NumPy without it
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+@njit(cache=True)
+def _confidence_kernel(amounts: np.ndarray, intervals: np.ndarray) -> float:
+    """Score a pattern from its amounts and day intervals between occurrences"""
+    n = amounts.size
+    base_score = min(n / 10.0, 1.0)  # More transactions = higher confidence
+    
+    # Check amount consistency
+    amount_consistency = 0.5
+    if n > 0:
+        avg_amount = amounts.mean()
+        if avg_amount > 0:
+            amount_variance = ((amounts - avg_amount) ** 2).sum() / n
+            amount_consistency = 1.0 / (1.0 + amount_variance / (avg_amount ** 2))
+    
+    # Check date regularity
+    date_regularity = 0.5
+    if intervals.size > 0:
+        avg_interval = intervals.mean()
+        if avg_interval > 0:
+            interval_variance = ((intervals - avg_interval) ** 2).sum() / intervals.size
+            date_regularity = 1.0 / (1.0 + interval_variance / (avg_interval ** 2))
+    
+    # Combine scores
+    return min(base_score * 0.4 + amount_consistency * 0.3 + date_regularity * 0.3, 1.0)
+
+# Description normalization patterns, applied in order to lower-cased text
+_DESCRIPTION_SUBSTITUTIONS = [
+    (re.compile(r'\b[a-z]{2}\d{8}[a-z]{2}\b'), '[REF]'),  # M-Pesa refs like NL12345678MN
+    (re.compile(r'\b\d{10,12}\b'), '[REF]'),  # Long numbers
+    (re.compile(r'\bksh\.?\s*\d+(?:,\d{3})*(?:\.\d{2})?\b'), '[AMOUNT]'),  # Amounts
+    (re.compile(r'\b\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4}\b'), '[DATE]'),  # Dates
+    (re.compile(r'\b\d{1,2}:\d{2}\b'), '[TIME]'),  # Times
+    (re.compile(r'\b0[17]\d{8}\b'), '[PHONE]'),  # Phone numbers
+]
+_MERCHANT_NUMBER_PATTERN = re.compile(r'\b(paybill|till)\s+\d+\b')
+_TRANSFER_PARTY_PATTERN = re.compile(r'(sent to|received from)\s+[^\s]+')
+
+def extract_description_pattern(description: str) -> str:
+    """
+    Extract a pattern from transaction description for grouping
+    
+    Stored on transaction documents as the "pattern" field when they are written,
+    so frequency analysis doesn't have to recompute it on every read.
+    """
+    # Clean and normalize description, collapsing whitespace in the same step
+    # (the substitutions below never introduce whitespace)
+    desc = ' '.join(description.lower().split())
+    
+    # Remove transaction-specific details (amounts, dates, reference numbers)
+    for pattern, placeholder in _DESCRIPTION_SUBSTITUTIONS:
+        desc = pattern.sub(placeholder, desc)
+    
+    # Create semantic patterns for common transaction types
+    if 'paybill' in desc or 'till' in desc or 'buy goods' in desc:
+        # Extract merchant info but normalize transaction details
+        desc = _MERCHANT_NUMBER_PATTERN.sub(r'\1 [NUMBER]', desc)
+    
+    if 'sent to' in desc or 'received from' in desc:
+        # Normalize person-to-person transfers
+        desc = _TRANSFER_PARTY_PATTERN.sub(r'\1 [PERSON]', desc)
+    
+    return desc
+
 @dataclass
 class FrequentTransaction:
     """Represents a frequently occurring transaction pattern"""
@@ -26,6 +100,12 @@ class FrequentTransaction:
 class TransactionFrequencyAnalyzer:
     """Analyzes transaction patterns to identify frequently occurring transactions"""
     
+    # Upper bound on transactions pulled per analysis (most recent first)
+    MAX_ANALYZED_TRANSACTIONS = 1000
+    
+    # Only the fields the analysis reads (_id is always returned)
+    ANALYSIS_PROJECTION = {"description": 1, "amount": 1, "date": 1, "category_id": 1, "pattern": 1}
+    
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
         
@@ -33,7 +113,9 @@ class TransactionFrequencyAnalyzer:
         self, 
         user_id: str, 
         min_frequency: int = 3,
-        days_back: int = 90
+        days_back: int = 90,
+        top_n: Optional[int] = None,
+        uncategorized_only: bool = False
     ) -> List[FrequentTransaction]:
         """
         Analyze transactions to find patterns that occur frequently
@@ -42,116 +124,154 @@ class TransactionFrequencyAnalyzer:
             user_id: User ID to analyze
             min_frequency: Minimum number of occurrences to consider frequent
             days_back: Number of days to look back for analysis
+            top_n: Only return the N highest ranked patterns (all patterns if None)
+            uncategorized_only: Skip patterns that are consistently categorized with
+                high confidence before doing any per-pattern category lookups
             
         Returns:
             List of frequent transaction patterns
         """
         
         # Calculate date range
-        end_date = datetime.now()
+        end_date = datetime.now(timezone.utc)
         start_date = end_date - timedelta(days=days_back)
         
-        # Get transactions for analysis
-        transactions_docs = await self.db.transactions.find({
-            "user_id": user_id,
-            "date": {"$gte": start_date, "$lte": end_date}
-        }).to_list(1000)
+        # Stream the most recent transactions for analysis (raw docs - this service only reads fields)
+        cursor = self.db.transactions.find(
+            {
+                "user_id": user_id,
+                "date": {"$gte": start_date, "$lte": end_date}
+            },
+            self.ANALYSIS_PROJECTION
+        ).sort("date", -1).limit(self.MAX_ANALYZED_TRANSACTIONS)
         
-        if not transactions_docs:
+        # Group transactions by similarity patterns as they arrive, keeping
+        # only patterns that occur often enough to be analyzed
+        patterns = await self._group_by_similarity(cursor, min_frequency)
+        if not patterns:
             return []
         
-        # Convert to Transaction objects
-        transactions = []
-        for doc in transactions_docs:
-            doc["id"] = str(doc["_id"])
-            del doc["_id"]
-            transactions.append(Transaction(**doc))
+        # Resolve "Other" categories once so uncategorized patterns can be told
+        # apart without looking up each pattern's category
+        other_category_ids = None
+        if uncategorized_only:
+            other_docs = await self.db.categories.find({"name": "Other"}, {"_id": 1}).to_list(None)
+            other_category_ids = {doc["_id"] for doc in other_docs}
         
-        # Group transactions by similarity patterns
-        patterns = self._group_by_similarity(transactions)
-        
-        # Filter patterns by frequency and analyze
-        frequent_patterns = []
-        for pattern, txn_group in patterns.items():
-            if len(txn_group) >= min_frequency:
-                frequent_txn = await self._analyze_pattern(pattern, txn_group)
-                if frequent_txn:
-                    frequent_patterns.append(frequent_txn)
+        # Analyze frequent patterns concurrently
+        analyzed = await asyncio.gather(*[
+            self._analyze_pattern(pattern, txn_group, other_category_ids)
+            for pattern, txn_group in patterns.items()
+        ])
+        frequent_patterns = [frequent_txn for frequent_txn in analyzed if frequent_txn]
         
         # Sort by frequency and confidence
-        frequent_patterns.sort(key=lambda x: (x.count, x.confidence_score), reverse=True)
+        rank_key = lambda x: (x.count, x.confidence_score)
+        if top_n is not None:
+            return heapq.nlargest(top_n, frequent_patterns, key=rank_key)
+        frequent_patterns.sort(key=rank_key, reverse=True)
         
         return frequent_patterns
     
-    def _group_by_similarity(self, transactions: List[Transaction]) -> Dict[str, List[Transaction]]:
-        """Group transactions by similarity patterns"""
-        patterns = defaultdict(list)
-        
-        for transaction in transactions:
-            # Create pattern from description
-            pattern = self._extract_pattern(transaction.description)
-            patterns[pattern].append(transaction)
+    async def _group_by_similarity(
+        self,
+        transactions: AsyncIterable[Dict[str, Any]],
+        min_frequency: int = 1
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Group transactions from an async cursor by similarity patterns
         
-        return dict(patterns)
+        Patterns seen fewer than min_frequency times are dropped before any
+        groups are built, so mostly-unique descriptions cost only a count.
+        """
+        docs = []
+        doc_patterns = []
+        
+        async for transaction in transactions:
+            # Use the pattern persisted at write time, computing it for legacy rows
+            docs.append(transaction)
+            doc_patterns.append(transaction.get("pattern") or self._extract_pattern(transaction["description"]))
+        
+        # Sort indices of frequent patterns and collect each contiguous run as a group
+        pattern_counts = Counter(doc_patterns)
+        order = sorted(
+            (i for i, pattern in enumerate(doc_patterns) if pattern_counts[pattern] >= min_frequency),
+            key=doc_patterns.__getitem__
+        )
+        return {
+            pattern: [docs[i] for i in indices]
+            for pattern, indices in groupby(order, key=doc_patterns.__getitem__)
+        }
     
     def _extract_pattern(self, description: str) -> str:
         """Extract a pattern from transaction description for grouping"""
-        # Clean and normalize description
-        desc = description.lower().strip()
-        
-        # Remove transaction-specific details (amounts, dates, reference numbers)
-        # Remove common M-Pesa reference patterns
-        desc = re.sub(r'\b[a-z]{2}\d{8}[a-z]{2}\b', '[REF]', desc)  # M-Pesa refs like NL12345678MN
-        desc = re.sub(r'\b\d{10,12}\b', '[REF]', desc)  # Long numbers
-        desc = re.sub(r'\bksh\.?\s*\d+(?:,\d{3})*(?:\.\d{2})?\b', '[AMOUNT]', desc)  # Amounts
-        desc = re.sub(r'\b\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4}\b', '[DATE]', desc)  # Dates
-        desc = re.sub(r'\b\d{1,2}:\d{2}\b', '[TIME]', desc)  # Times
-        desc = re.sub(r'\b0[17]\d{8}\b', '[PHONE]', desc)  # Phone numbers
-        
-        # Remove extra whitespace
-        desc = re.sub(r'\s+', ' ', desc).strip()
-        
-        # Create semantic patterns for common transaction types
-        if any(word in desc for word in ['paybill', 'till', 'buy goods']):
-            # Extract merchant info but normalize transaction details
-            desc = re.sub(r'\b(paybill|till)\s+\d+\b', lambda m: f'{m.group(1)} [NUMBER]', desc)
-        
-        if 'sent to' in desc or 'received from' in desc:
-            # Normalize person-to-person transfers
-            desc = re.sub(r'(sent to|received from)\s+[^\s]+', r'\1 [PERSON]', desc)
-        
-        return desc
+        return extract_description_pattern(description)
     
-    async def _analyze_pattern(self, pattern: str, transactions: List[Transaction]) -> Optional[FrequentTransaction]:
-        """Analyze a group of similar transactions"""
+    async def _analyze_pattern(
+        self,
+        pattern: str,
+        transactions: List[Dict[str, Any]],
+        other_category_ids: Optional[set] = None
+    ) -> Optional[FrequentTransaction]:
+        """
+        Analyze a group of similar transactions
+        
+        When other_category_ids is given, patterns that don't need attention
+        (consistently categorized, not "Other", confident) are skipped.
+        """
         if not transactions:
             return None
         
-        # Calculate metrics
+        # Calculate metrics, date range, samples, IDs and category distribution in one pass
         count = len(transactions)
-        total_amount = sum(t.amount for t in transactions)
-        avg_amount = total_amount / count
-        
-        # Get date range
-        dates = [t.date for t in transactions]
-        first_seen = min(dates)
-        last_seen = max(dates)
+        total_amount = 0.0
+        first_seen = last_seen = None
+        dates = []
+        description_samples = []
+        seen_descriptions = set()
+        transaction_ids = []
+        category_counts = {}
+        best_category, best_category_count = None, 0
+        
+        for t in transactions:
+            total_amount += t["amount"]
+            
+            date = t["date"]
+            dates.append(date)
+            if first_seen is None or date < first_seen:
+                first_seen = date
+            if last_seen is None or date > last_seen:
+                last_seen = date
+            
+            # Keep up to five distinct sample descriptions
+            description = t["description"]
+            if len(description_samples) < 5 and description not in seen_descriptions:
+                seen_descriptions.add(description)
+                description_samples.append(description)
+            
+            transaction_ids.append(str(t["_id"]))
+            
+            # Track the most common category as we go
+            category = t.get("category_id")
+            category_count = category_counts.get(category, 0) + 1
+            category_counts[category] = category_count
+            if category_count > best_category_count:
+                best_category, best_category_count = category, category_count
         
-        # Collect sample descriptions
-        description_samples = list(set(t.description for t in transactions))[:5]
+        avg_amount = total_amount / count
         
-        # Get transaction IDs
-        transaction_ids = [t.id for t in transactions]
+        # Use the most common category only if it covers a majority
+        category_id = best_category if best_category_count > count * 0.5 else None
         
-        # Analyze category distribution
-        categories = [t.category_id for t in transactions]
-        category_counts = defaultdict(int)
-        for cat in categories:
-            category_counts[cat] += 1
+        # Calculate confidence score
+        confidence_score = self._calculate_confidence(
+            transactions, pattern, np.array(dates, dtype="datetime64[us]")
+        )
         
-        # Find most common category
-        most_common_category = max(category_counts.items(), key=lambda x: x[1]) if category_counts else (None, 0)
-        category_id = most_common_category[0] if most_common_category[1] > count * 0.5 else None
+        # Short-circuit patterns the caller has no interest in
+        if (other_category_ids is not None and category_id and
+                category_id not in other_category_ids and confidence_score >= 0.7):
+            return None
         
         # Get category name
         category_name = None
@@ -160,9 +280,6 @@ class TransactionFrequencyAnalyzer:
             if category_doc:
                 category_name = category_doc["name"]
         
-        # Calculate confidence score
-        confidence_score = self._calculate_confidence(transactions, pattern)
-        
         # Suggest category if not consistently categorized
         suggested_category = await self._suggest_category(pattern, transactions) if not category_id else None
         
@@ -181,42 +298,36 @@ class TransactionFrequencyAnalyzer:
             suggested_category=suggested_category
         )
     
-    def _calculate_confidence(self, transactions: List[Transaction], pattern: str) -> float:
-        """Calculate confidence score for the pattern"""
-        base_score = min(len(transactions) / 10.0, 1.0)  # More transactions = higher confidence
-        
-        # Check amount consistency
-        amounts = [t.amount for t in transactions]
-        if amounts:
-            avg_amount = sum(amounts) / len(amounts)
-            amount_variance = sum((a - avg_amount) ** 2 for a in amounts) / len(amounts)
-            amount_consistency = 1.0 / (1.0 + amount_variance / (avg_amount ** 2)) if avg_amount > 0 else 0.5
-        else:
-            amount_consistency = 0.5
+    def _calculate_confidence(
+        self,
+        transactions: List[Dict[str, Any]],
+        pattern: str,
+        dates: Optional[np.ndarray] = None
+    ) -> float:
+        """
+        Calculate confidence score for the pattern
+        
+        dates may be passed as a datetime64 array already collected by the caller.
+        """
+        amounts = np.fromiter((t["amount"] for t in transactions), dtype=np.float64, count=len(transactions))
         
-        # Check date regularity
+        # Date regularity is only meaningful with at least three occurrences
         if len(transactions) >= 3:
-            dates = sorted([t.date for t in transactions])
-            intervals = [(dates[i+1] - dates[i]).days for i in range(len(dates)-1)]
-            avg_interval = sum(intervals) / len(intervals) if intervals else 30
-            interval_variance = sum((i - avg_interval) ** 2 for i in intervals) / len(intervals) if intervals else 0
-            date_regularity = 1.0 / (1.0 + interval_variance / (avg_interval ** 2)) if avg_interval > 0 else 0.5
+            if dates is None:
+                dates = np.array([t["date"] for t in transactions], dtype="datetime64[us]")
+            dates = np.sort(dates)
+            intervals = (np.diff(dates) // np.timedelta64(1, "D")).astype(np.float64)
         else:
-            date_regularity = 0.5
+            intervals = np.empty(0, dtype=np.float64)
         
-        # Combine scores
-        confidence = (base_score * 0.4 + amount_consistency * 0.3 + date_regularity * 0.3)
-        return min(confidence, 1.0)
+        return float(_confidence_kernel(amounts, intervals))
     
-    async def _suggest_category(self, pattern: str, transactions: List[Transaction]) -> Optional[str]:
+    async def _suggest_category(self, pattern: str, transactions: List[Dict[str, Any]]) -> Optional[str]:
         """Suggest a category for the transaction pattern"""
         # Get all categories
         categories_docs = await self.db.categories.find().to_list(100)
         categories = [Category(**{**doc, "id": str(doc["_id"])}) for doc in categories_docs]
         
-        # Use the categorization service logic
-        from services.categorization import CategorizationService
-        
         # Try to categorize based on the pattern
         suggested_category_id = CategorizationService.auto_categorize(pattern, categories)
         
@@ -233,7 +344,9 @@ class TransactionFrequencyAnalyzer:
         min_frequency: int = 3
     ) -> List[FrequentTransaction]:
         """Get frequent transactions that need categorization"""
-        frequent_transactions = await self.analyze_frequent_transactions(user_id, min_frequency)
+        frequent_transactions = await self.analyze_frequent_transactions(
+            user_id, min_frequency, uncategorized_only=True
+        )
         
         # Filter for transactions that need attention
         uncategorized = []
@@ -251,44 +364,87 @@ class TransactionFrequencyAnalyzer:
         user_id: str, 
         pattern: str, 
         category_id: str,
-        transaction_ids: List[str]
+        transaction_ids: Optional[List[str]] = None
     ) -> int:
         """Apply a category to all transactions matching a pattern"""
         # Update all transactions with the new category
-        result = await self.db.transactions.update_many(
-            {
-                "_id": {"$in": transaction_ids},
-                "user_id": user_id
-            },
+        return await self._update_pattern_transactions(
+            user_id,
+            pattern,
+            transaction_ids,
             {
-                "$set": {
-                    "category_id": category_id,
-                    "updated_at": datetime.utcnow()
-                }
+                "category_id": category_id,
+                "updated_at": datetime.now(timezone.utc)
             }
         )
-        
-        return result.modified_count
     
     async def mark_pattern_as_reviewed(
         self, 
         user_id: str, 
         pattern: str,
-        transaction_ids: List[str]
+        transaction_ids: Optional[List[str]] = None
     ) -> int:
         """Mark a pattern as reviewed to avoid future prompts"""
         # Add metadata to mark as reviewed
-        result = await self.db.transactions.update_many(
-            {
-                "_id": {"$in": transaction_ids},
-                "user_id": user_id
-            },
+        return await self._update_pattern_transactions(
+            user_id,
+            pattern,
+            transaction_ids,
             {
-                "$set": {
-                    "pattern_reviewed": True,
-                    "pattern_reviewed_at": datetime.utcnow()
-                }
+                "pattern_reviewed": True,
+                "pattern_reviewed_at": datetime.now(timezone.utc)
             }
         )
+    
+    async def _update_pattern_transactions(
+        self,
+        user_id: str,
+        pattern: str,
+        transaction_ids: Optional[List[str]],
+        fields: Dict[str, Any]
+    ) -> int:
+        """
+        Set fields on a user's transactions by their persisted pattern, falling
+        back to the explicit ID list for legacy rows without a pattern field
+        """
+        result = await self.db.transactions.update_many(
+            {"user_id": user_id, "pattern": pattern},
+            {"$set": fields}
+        )
+        
+        if result.matched_count == 0 and transaction_ids:
+            result = await self.db.transactions.update_many(
+                {
+                    "_id": {"$in": transaction_ids},
+                    "user_id": user_id
+                },
+                {"$set": fields}
+            )
         
         return result.modified_count
+    
+    async def ensure_pattern_index(self) -> None:
+        """Index transactions by user and persisted pattern"""
+        await self.db.transactions.create_index([("user_id", 1), ("pattern", 1)])
+    
+    async def backfill_patterns(self, batch_size: int = 500) -> int:
+        """Persist the pattern field on transactions written before it existed"""
+        updated = 0
+        operations = []
+        cursor = self.db.transactions.find({"pattern": {"$exists": False}}, {"description": 1})
+        
+        async for doc in cursor:
+            operations.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"pattern": extract_description_pattern(doc.get("description") or "")}}
+            ))
+            if len(operations) >= batch_size:
+                await self.db.transactions.bulk_write(operations, ordered=False)
+                updated += len(operations)
+                operations = []
+        
+        if operations:
+            await self.db.transactions.bulk_write(operations, ordered=False)
+            updated += len(operations)
+        
+        return updated
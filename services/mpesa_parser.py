@@ -1,11 +1,245 @@
 import re
 import hashlib
+import functools
 from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta
 from models.transaction import TransactionCreate, MPesaDetails
 import phonenumbers
 from phonenumbers import NumberParseException
 
+try:
+    import re2
+except ImportError:  # google-re2 is optional; message patterns fall back to re
+    re2 = None
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional; categorization falls back to substring scans
+    ahocorasick = None
+
+def _compile_message_pattern(pattern: str, ignore_case: bool = True):
+    """
+    Compile a message pattern, using RE2 when available.
+
+    RE2 matches in linear time, so the lazy '.*?' gaps between the optional
+    balance/transaction groups cannot backtrack pathologically on long input.
+    The message patterns use no backreferences or lookaround, so they compile
+    unchanged under both engines.
+    """
+    if re2 is not None:
+        options = re2.Options()
+        options.case_sensitive = not ignore_case
+        return re2.compile(pattern, options)
+    return re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+
+# Precompiled helper patterns used on every parse
+# Transaction ID before "confirmed": match() for the modern leading form, search() for legacy
+_RE_TXID_CONFIRMED = re.compile(r'[A-Z0-9]{6,12}\s+confirmed', re.IGNORECASE)
+_RE_CURRENCY = re.compile(r'ksh?\.?\s*[0-9,]+(?:\.[0-9]{1,2})?', re.IGNORECASE)
+_RE_PHONE_STRIP = re.compile(r'[^\d+]')
+_RE_KE_PHONE_FALLBACK = re.compile(r'^(\+254|254|0)\d{9}$')
+# Currency spellings that normalize to "ksh"/"kes" (ksh., kshs, ksh.s, kes.)
+_RE_CURRENCY_TOKEN = re.compile(r'ksh(?:\.s?|s)|kes\.')
+_RE_TRANSACTION_COST = re.compile(r'transaction cost[:\s,]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)', re.IGNORECASE)
+_RE_GENERIC_AMOUNT = re.compile(r'(?:ksh?|kes)\s*([0-9,]+(?:\.[0-9]{1,2})?)')
+_RE_GENERIC_TRANSACTION_ID = re.compile(r'(?:transaction|receipt|ref)[:\s]*([a-z0-9\-]{6,})')
+_RE_QUALITY_TRANSACTION_ID = re.compile(r'[A-Z0-9]{8,12}')
+_RE_SLASH_DATE = re.compile(r'\d{1,2}/\d{1,2}/\d{2,4}')
+_RE_CLOCK_TIME = re.compile(r'\d{1,2}:\d{2}\s*(?:AM|PM)', re.IGNORECASE)
+_RE_PAYBILL_NUMBER = re.compile(r'paybill\s+(\d+)')
+_RE_ON_DATE_AT_TIME = re.compile(r'on\s+([0-9/\-]+)\s+at\s+([0-9:]+\s*(?:AM|PM)?)', re.IGNORECASE)
+_RE_COMBINED_DATE_TIME = re.compile(r'(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s+(?:at\s+)?(\d{1,2}:\d{2}\s*(?:AM|PM)?)', re.IGNORECASE)
+
+# Fee patterns searched by _extract_all_fees: (fee type, keep zero fees, patterns tried in order)
+_FEE_PATTERNS = [
+    # Enhanced transaction cost patterns (most common M-Pesa fees)
+    ('transaction_fee', True, [
+        re.compile(r'transaction cost[:\s,]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'transaction fee[:\s,]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'mpesa fee[:\s,]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'charge[d]?[:\s,]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        # Handle "cost, Ksh0.00" format
+        re.compile(r'cost[,\s]+(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+    ]),
+    # Enhanced access fee patterns (Fuliza specific)
+    ('access_fee', False, [
+        re.compile(r'access fee charged[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'access fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        # Lazy gaps: RE2 keeps these linear on long input with many "fuliza"s
+        _compile_message_pattern(r'fuliza.*?fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)', ignore_case=False),
+        _compile_message_pattern(r'fuliza.*?charged[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)', ignore_case=False),
+    ]),
+    # Service fee patterns (bank transfers, etc.)
+    ('service_fee', False, [
+        re.compile(r'service fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'service charge[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+    ]),
+    # Processing fee patterns
+    ('processing_fee', False, [
+        re.compile(r'processing fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'handling fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+    ]),
+    # ATM and withdrawal fee patterns
+    ('atm_fee', False, [
+        re.compile(r'atm fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'withdrawal fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'cash withdrawal fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+    ]),
+    # Bank and agent charges
+    ('bank_charge', False, [
+        re.compile(r'bank charge[s]?[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'agent fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'commission[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+    ]),
+    # Paybill and Till specific fees
+    ('merchant_fee', False, [
+        re.compile(r'paybill fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'till fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'merchant fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+    ]),
+    # Interest charges (loans, overdrafts)
+    ('interest_charge', False, [
+        re.compile(r'interest[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'interest charge[d]?[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'loan interest[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+    ]),
+    # Late payment fees
+    ('late_fee', False, [
+        re.compile(r'late fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'penalty[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+        re.compile(r'late payment[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)'),
+    ]),
+]
+
+def _literal_prefix(pattern: str) -> str:
+    """
+    Leading literal text a pattern needs before any regex syntax, e.g.
+    'charge' for r'charge[d]?...'. A final letter made optional by a
+    following quantifier is not required, so it is dropped
+    """
+    prefix = re.match(r'[a-z ]*', pattern).group()
+    if pattern[len(prefix):len(prefix) + 1] in ('?', '*', '{'):
+        prefix = prefix[:-1]
+    return prefix
+
+# _FEE_PATTERNS with each pattern paired with its literal prefix, so fee types whose
+# keywords are absent from a message are skipped with substring checks
+_FEE_SEARCHES = [
+    (fee_type, keep_zero, tuple((_literal_prefix(pattern.pattern), pattern) for pattern in patterns))
+    for fee_type, keep_zero, patterns in _FEE_PATTERNS
+]
+
+# Date formats in parse_transaction_date, by index
+_DATE_PATTERNS = [
+    re.compile(r'(\d{1,2})/(\d{1,2})/(\d{2,4})'),    # M/D/YY or MM/DD/YYYY (most common)
+    re.compile(r'(\d{1,2})-(\d{1,2})-(\d{2,4})'),    # M-D-YY or MM-DD-YYYY
+    re.compile(r'(\d{2,4})[/\-](\d{1,2})[/\-](\d{1,2})'),  # YYYY/MM/DD or YY/MM/DD
+    re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{2,4})'),  # M.D.YY (European style)
+]
+
+_TIME_PATTERNS = [
+    re.compile(r'(\d{1,2}):(\d{2})\s*(AM|PM)'),     # 7:43 AM or 11:51 PM
+    re.compile(r'(\d{1,2}):(\d{2}):(\d{2})\s*(AM|PM)'),  # 7:43:00 AM
+    re.compile(r'(\d{1,2}):(\d{2})'),               # 24-hour format 07:43
+    re.compile(r'(\d{1,2})\.(\d{2})'),              # Alternative format 7.43
+    re.compile(r'(\d{1,2})(\d{2})\s*(AM|PM)'),      # 743 AM (no colon)
+]
+
+def _split_slash_date(date_str: str) -> Optional[Tuple[str, str, str]]:
+    """
+    Split the common "6/10/25" layout without a regex.
+
+    Returns the same groups the first _DATE_PATTERNS entry would, or None when
+    the string is anything other than exactly M/D/Y digits.
+    """
+    parts = date_str.split('/')
+    if len(parts) != 3 or not date_str.isascii():
+        return None
+    month, day, year = parts
+    if (month.isdigit() and day.isdigit() and year.isdigit()
+            and len(month) <= 2 and len(day) <= 2 and 2 <= len(year) <= 4):
+        return month, day, year
+    return None
+
+def _split_clock_time(time_upper: str) -> Optional[Tuple[str, ...]]:
+    """
+    Split the common "7:43 AM" / "14:30" layouts of an upper-cased time without a regex.
+
+    Returns the same groups the first matching _TIME_PATTERNS entry would, or
+    None for any other layout.
+    """
+    hour, sep, rest = time_upper.partition(':')
+    minute = rest[:2]
+    if not (sep and hour.isascii() and hour.isdigit() and len(hour) <= 2
+            and len(minute) == 2 and minute.isascii() and minute.isdigit()):
+        return None
+    suffix = rest[2:].lstrip()
+    if suffix in ('AM', 'PM'):
+        return hour, minute, suffix
+    if not suffix:
+        return hour, minute
+    return None
+
+# Date-time layouts searched for by extract_date_from_message, most specific first
+_MESSAGE_DATE_TIME_PATTERNS = [
+    # "on 6/10/25 at 7:43 AM"
+    re.compile(r'on\s+(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s+at\s+(\d{1,2}:\d{2}\s*(?:AM|PM)?)', re.IGNORECASE),
+    # "6/10/25 at 7:43 AM"
+    re.compile(r'(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s+at\s+(\d{1,2}:\d{2}\s*(?:AM|PM)?)', re.IGNORECASE),
+    # "6/10/25 7:43 AM" (no "at")
+    re.compile(r'(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s+(\d{1,2}:\d{2}\s*(?:AM|PM)?)', re.IGNORECASE),
+    # Just date "on 6/10/25"
+    re.compile(r'on\s+(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})', re.IGNORECASE),
+    # Timestamp format "2025-10-06T19:43:00"
+    re.compile(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})', re.IGNORECASE),
+]
+
+def _currency_token(match) -> str:
+    """Canonical currency token ("ksh"/"kes") for a _RE_CURRENCY_TOKEN match"""
+    return match.group()[:3]
+
+def _copy_parse_result(value):
+    """
+    Copy a cached parse result. Results only hold dicts, lists and immutable
+    scalars, so this is a much cheaper equivalent of copy.deepcopy.
+    """
+    if isinstance(value, dict):
+        return {key: _copy_parse_result(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_parse_result(item) for item in value]
+    return value
+
+def _build_category_automaton(category_keywords):
+    """
+    Build an Aho-Corasick automaton mapping each keyword to (priority, category).
+
+    A keyword listed under several categories keeps its highest-priority one.
+    Returns None when pyahocorasick is not installed.
+    """
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for priority, (category, keywords) in enumerate(category_keywords):
+        for keyword in keywords:
+            if keyword not in automaton:
+                automaton.add_word(keyword, (priority, category))
+    automaton.make_automaton()
+    return automaton
+
+def _flatten_patterns(compiled_patterns, pattern_order, required_text):
+    """
+    Flatten compiled patterns into (pattern_type, required_text, regex) triples,
+    ordered types first. Types without required text get '' (always present)
+    """
+    ordered_types = list(pattern_order) + [
+        pattern_type for pattern_type in compiled_patterns if pattern_type not in pattern_order
+    ]
+    return tuple(
+        (pattern_type, required_text.get(pattern_type, ''), pattern)
+        for pattern_type in ordered_types
+        for pattern in compiled_patterns.get(pattern_type, [])
+    )
+
 class MPesaParser:
     """
     Robust M-Pesa SMS message parser that handles various Kenyan Safaricom M-Pesa formats
@@ -94,58 +328,208 @@ class MPesaParser:
             r'(?:ksh?|kes)\s*([0-9,]+(?:\.[0-9]{1,2})?)\s+(?:sent to|paid to)\s+(.+?)\s+till\s+([0-9]+).*?(?:new m-?pesa balance.*?(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?))?.*?(?:transaction[:\s]*([a-z0-9\-]{6,}))?'
         ]
     }
+
+    # Pattern types in order of specificity (most specific first)
+    PATTERN_ORDER = (
+        'compound_received_fuliza',  # Most specific - compound transactions
+        'fuliza_loan',               # Fuliza loans
+        'fuliza_repayment',          # Fuliza repayments
+        'modern_sent',               # Modern sent transactions
+        'modern_received',           # Modern received transactions
+        'received',                  # Legacy received
+        'sent',                      # Legacy sent
+        'withdrawal',                # Withdrawals
+        'airtime',                   # Airtime purchases
+        'paybill',                   # Paybill payments
+        'till'                       # Till payments
+    )
+
+    # Known Kenyan Utility Paybill Numbers
+    UTILITY_PAYBILLS = {
+        '888880': 'Utilities',  # KPLC Prepaid
+        '888888': 'Utilities',  # KPLC Postpaid
+        '444400': 'Utilities',  # Nairobi Water
+        '895500': 'Utilities',  # Mombasa Water
+        '517000': 'Utilities',  # Kisumu Water
+        '111444': 'Utilities',  # Nakuru Water
+        '511000': 'Utilities',  # Eldoret Water
+        '885100': 'Utilities',  # Kiambu Water
+        '880600': 'Utilities',  # Garissa Water
+        '363100': 'Utilities',  # Mavoko Water
+        '200200': 'Telecommunications',  # Safaricom
+    }
+
+    # Fallback indicators of a paybill/till bill payment
+    BILL_KEYWORDS = ('paybill', 'till', 'bill payment')
+
+    # Keyword categories in priority order; the first category with any
+    # keyword present in the message or recipient wins
+    CATEGORY_KEYWORDS = (
+        ('Utilities', (
+            # Electricity
+            'kplc', 'kenya power', 'electricity', 'prepaid', 'postpaid', 'power',
+            # Water
+            'water', 'nairobi water', 'mombasa water', 'kisumu water', 'nakuru water',
+            'eldoret water', 'kiambu water', 'garissa water', 'mavoko water', 'ncwsc',
+            # Telecommunications & Internet
+            'safaricom', 'airtel', 'telkom', 'data bundles', 'airtime', 'bundles',
+            'internet', 'wifi', 'broadband', 'faiba', 'zuku', 'wananchi',
+            # Gas
+            'gas', 'lpg', 'cooking gas'
+        )),
+        ('Transport', (
+            'uber', 'bolt', 'taxi', 'matatu', 'boda', 'boda boda', 'fuel', 'petrol',
+            'parking', 'transport', 'bus', 'travel', 'fare', 'sgr', 'railway',
+            'kenya airways', 'jambojet', 'fly540', 'flight', 'airline'
+        )),
+        ('Food & Dining', (
+            'restaurant', 'hotel', 'food', 'cafe', 'kitchen', 'meal',
+            'lunch', 'dinner', 'breakfast', 'snack', 'delivery', 'takeaway',
+            'kfc', 'pizza', 'subway', 'java', 'artcaffe', 'chicken inn'
+        )),
+        ('Shopping', (
+            'shop', 'store', 'market', 'supermarket', 'mall', 'outlet',
+            'retail', 'purchase', 'buy', 'nakumatt', 'tuskys', 'carrefour',
+            'naivas', 'chandarana', 'quickmart', 'cleanshelf', 'eastmatt'
+        )),
+        ('Health', (
+            'hospital', 'clinic', 'pharmacy', 'medical', 'doctor', 'health',
+            'medicine', 'treatment', 'consultation', 'nhif', 'aga khan',
+            'nairobi hospital', 'kenyatta hospital', 'mater hospital'
+        )),
+        ('Education', (
+            'school', 'university', 'college', 'education', 'tuition',
+            'fees', 'academic', 'learning', 'course', 'uon', 'ku', 'mku',
+            'strathmore', 'usiu', 'kabarak'
+        )),
+        ('Entertainment', (
+            'cinema', 'movie', 'game', 'sport', 'entertainment', 'music',
+            'concert', 'show', 'theatre', 'fun', 'betting', 'sportpesa',
+            'betin', 'mcheza', 'club', 'disco'
+        )),
+        ('Financial Services', (
+            'bank', 'equity', 'kcb', 'cooperative', 'barclays', 'standard chartered',
+            'family bank', 'gt bank', 'loan', 'credit', 'savings', 'account',
+            'ncba', 'diamond trust', 'i&m bank', 'housing finance', 'sidian bank',
+            'centum', 'sacco'
+        )),
+        ('Government & Services', (
+            'government', 'ministry', 'county', 'kra', 'nhif', 'nssf',
+            'huduma', 'license', 'permit', 'registration', 'ntsa', 'lands',
+            'attorney general', 'court', 'police', 'immigration'
+        )),
+    )
+
+    # All category keywords in one automaton (None without pyahocorasick)
+    _CATEGORY_AUTOMATON = _build_category_automaton(CATEGORY_KEYWORDS)
+
+    # Display names for Safaricom products, checked in order
+    SAFARICOM_PRODUCT_NAMES = (
+        ('DATA BUNDLES', 'Safaricom Data Bundles'),
+        ('AIRTIME', 'Safaricom Airtime'),
+    )
+
+    # Per-pattern-type group extractors used by _extract_transaction_details
+    _EXTRACTORS = {
+        'modern_sent': '_extract_modern_sent',
+        'modern_received': '_extract_modern_received',
+        'fuliza_loan': '_extract_fuliza_loan',
+        'fuliza_repayment': '_extract_fuliza_repayment',
+        'compound_received_fuliza': '_extract_compound_received_fuliza',
+        'received': '_extract_received',
+        'sent': '_extract_sent',
+        'till': '_extract_sent',
+        'paybill': '_extract_paybill',
+        'withdrawal': '_extract_withdrawal',
+        'airtime': '_extract_airtime',
+    }
+
+    # Fields an extractor may produce
+    _DETAIL_FIELDS = (
+        'amount', 'recipient', 'phone_number', 'reference', 'balance_after',
+        'transaction_id', 'transaction_fee', 'access_fee', 'fuliza_limit',
+        'fuliza_outstanding', 'due_date', 'transaction_date'
+    )
+
+    # Lets extractors index optional groups past a pattern's arity (always None)
+    _GROUP_PADDING = (None,) * 8
+
+    # Indicators checked by is_mpesa_message
+    _PRIMARY_KEYWORDS = ('confirmed', 'mpesa', 'm-pesa', 'safaricom', 'fuliza')
+    _ACTION_KEYWORDS = ('sent to', 'received from', 'withdrawn', 'deposited', 'paid to', 'purchased')
+
+    # PATTERNS compiled once at class load
+    _COMPILED_PATTERNS = {
+        pattern_type: [_compile_message_pattern(pattern) for pattern in patterns]
+        for pattern_type, patterns in PATTERNS.items()
+    }
+
+    # Literal text every pattern of a type requires in the normalized message.
+    # Types whose text is missing are skipped without running their regexes
+    PATTERN_REQUIRED_TEXT = {
+        'compound_received_fuliza': 'fuliza',
+        'fuliza_loan': 'fuliza m-pesa amount is',
+        'fuliza_repayment': 'fuliza',
+        'modern_sent': 'sent to',
+        'modern_received': 'received',
+        'received': 'receive',
+        'withdrawal': 'withdraw',
+        'airtime': 'purchased airtime',
+        'paybill': 'paybill',
+        'till': 'till',
+    }
+
+    # Every compiled pattern flattened into a single (pattern_type, required_text,
+    # regex) sequence in PATTERN_ORDER priority, followed by any unordered types
+    _ORDERED_PATTERNS = _flatten_patterns(_COMPILED_PATTERNS, PATTERN_ORDER, PATTERN_REQUIRED_TEXT)
     
     @classmethod
-    def is_mpesa_message(cls, message: str) -> bool:
+    def is_mpesa_message(cls, message: str, message_lower: Optional[str] = None) -> bool:
         """
         Check if the message is likely an M-Pesa transaction message
         Enhanced to handle newer M-Pesa message formats
         """
-        message_lower = message.lower()
-
-        # Primary indicators
-        primary_keywords = ['confirmed', 'mpesa', 'm-pesa', 'safaricom', 'fuliza']
-        has_primary = any(keyword in message_lower for keyword in primary_keywords)
-
-        # Enhanced transaction ID pattern for newer formats (letters and numbers at start)
-        has_modern_transaction_id = bool(re.search(r'^[A-Z0-9]{6,12}\s+confirmed', message, re.IGNORECASE))
-        has_legacy_transaction_id = bool(re.search(r'[A-Z0-9]{6,12}\s+confirmed', message, re.IGNORECASE))
+        if message_lower is None:
+            message_lower = message.lower()
+
+        # Cheap substring rejections first so most non-M-Pesa SMS never reach a regex.
+        # Every currency amount the pattern below accepts contains "ks" (ks/ksh)
+        if 'ks' not in message_lower:
+            return False
+
+        # Transaction action or balance indicator
+        if 'balance' not in message_lower and not any(
+            keyword in message_lower for keyword in cls._ACTION_KEYWORDS
+        ):
+            return False
+
+        # Primary indicator, or a transaction ID pattern (letters and numbers
+        # before "confirmed"; the unanchored legacy form also covers modern IDs)
+        if not any(keyword in message_lower for keyword in cls._PRIMARY_KEYWORDS) \
+                and not _RE_TXID_CONFIRMED.search(message):
+            return False
 
         # Currency pattern (enhanced to handle variations)
-        has_currency = bool(re.search(r'ksh?\.?\s*[0-9,]+(?:\.[0-9]{1,2})?', message, re.IGNORECASE))
-
-        # Transaction action indicators
-        action_keywords = ['sent to', 'received from', 'withdrawn', 'deposited', 'paid to', 'purchased']
-        has_action = any(keyword in message_lower for keyword in action_keywords)
-
-        # Balance indicator
-        has_balance = 'balance' in message_lower
-
-        # Must have primary indicator or transaction ID pattern, plus currency and action
-        return (has_primary or has_modern_transaction_id or has_legacy_transaction_id) and has_currency and (has_action or has_balance)
+        return bool(_RE_CURRENCY.search(message))
     
     @classmethod
-    def normalize_message(cls, message: str) -> str:
+    def normalize_message(cls, message: str, message_lower: Optional[str] = None) -> str:
         """
         Normalize the message text for consistent parsing
         """
         if not message:
             return ""
+        if message_lower is None:
+            message_lower = message.lower()
+
+        # Collapse whitespace and line breaks in the lowercased text
+        message = ' '.join(message_lower.split())
 
-        # Convert to lowercase
-        message = message.lower()
-        
-        # Remove extra whitespace and line breaks
-        message = re.sub(r'\s+', ' ', message).strip()
-        
         # Normalize currency symbols
-        message = re.sub(r'ksh\.?s?', 'ksh', message)
-        message = re.sub(r'kes\.?', 'kes', message)
-        
-        # Normalize punctuation
-        message = re.sub(r'[.,;!]+\s*$', '', message)
-        
-        return message
+        message = _RE_CURRENCY_TOKEN.sub(_currency_token, message)
+
+        # Normalize trailing punctuation
+        return message.rstrip('.,;!')
     
     @classmethod
     def extract_amount(cls, amount_str: str) -> Optional[float]:
@@ -156,7 +540,7 @@ class MPesaParser:
             return None
             
         # Remove commas and whitespace
-        amount_str = re.sub(r'[,\s]', '', amount_str)
+        amount_str = ''.join(amount_str.replace(',', '').split())
         
         try:
             return float(amount_str)
@@ -170,9 +554,16 @@ class MPesaParser:
         """
         if not phone_str:
             return None
+        return cls._format_phone_number(phone_str)
 
+    @classmethod
+    @functools.lru_cache(maxsize=2048)
+    def _format_phone_number(cls, phone_str: str) -> Optional[str]:
+        """
+        Cached phonenumbers parse/validate/format; the same contacts recur across messages
+        """
         # Clean up the phone number string
-        phone_str = re.sub(r'[^\d+]', '', phone_str)
+        phone_str = _RE_PHONE_STRIP.sub('', phone_str)
 
         try:
             # Parse with Kenya country code
@@ -183,7 +574,7 @@ class MPesaParser:
             pass
 
         # Fallback: return cleaned number if it looks reasonable
-        if re.match(r'^(\+254|254|0)\d{9}$', phone_str):
+        if _RE_KE_PHONE_FALLBACK.match(phone_str):
             return phone_str
 
         return None
@@ -197,26 +588,21 @@ class MPesaParser:
             return None
 
         # Remove extra whitespace
-        recipient = re.sub(r'\s+', ' ', recipient.strip())
+        words = recipient.split()
+        recipient_upper = ' '.join(words).upper()
 
         # Handle common business name patterns
-        if 'SAFARICOM' in recipient.upper():
-            if 'DATA BUNDLES' in recipient.upper():
-                return 'Safaricom Data Bundles'
-            elif 'AIRTIME' in recipient.upper():
-                return 'Safaricom Airtime'
-            else:
-                return 'Safaricom'
+        if 'SAFARICOM' in recipient_upper:
+            for product, name in cls.SAFARICOM_PRODUCT_NAMES:
+                if product in recipient_upper:
+                    return name
+            return 'Safaricom'
 
         # Capitalize names properly
-        words = recipient.split()
         cleaned_words = []
         for word in words:
-            if word.isupper() and len(word) > 2:
-                # Convert all caps to title case
-                cleaned_words.append(word.title())
-            elif word.islower() and len(word) > 2:
-                # Convert all lowercase to title case
+            if len(word) > 2 and (word.isupper() or word.islower()):
+                # Convert all caps or all lowercase to title case
                 cleaned_words.append(word.title())
             else:
                 # Keep mixed case or short words as is
@@ -238,43 +624,39 @@ class MPesaParser:
             # If time_str is None, try to extract both date and time from date_str
             if time_str is None:
                 # Look for combined date-time patterns in the string
-                combined_pattern = r'(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s+(?:at\s+)?(\d{1,2}:\d{2}\s*(?:AM|PM)?)'
-                combined_match = re.search(combined_pattern, date_str, re.IGNORECASE)
+                combined_match = _RE_COMBINED_DATE_TIME.search(date_str)
                 if combined_match:
                     date_str = combined_match.group(1)
                     time_str = combined_match.group(2)
 
-            # Handle different date formats
-            date_patterns = [
-                r'(\d{1,2})/(\d{1,2})/(\d{2,4})',    # M/D/YY or MM/DD/YYYY (most common)
-                r'(\d{1,2})-(\d{1,2})-(\d{2,4})',    # M-D-YY or MM-DD-YYYY
-                r'(\d{2,4})[/\-](\d{1,2})[/\-](\d{1,2})',  # YYYY/MM/DD or YY/MM/DD
-                r'(\d{1,2})\.(\d{1,2})\.(\d{2,4})',  # M.D.YY (European style)
-            ]
-
-            date_match = None
-            date_format = None
-            for i, pattern in enumerate(date_patterns):
-                match = re.search(pattern, date_str)
-                if match:
-                    date_match = match
-                    date_format = i
-                    break
+            # Handle different date formats; the common M/D/YY layout skips the regexes
+            date_groups = _split_slash_date(date_str)
+            date_format = 0
+            if date_groups is None:
+                for i, pattern in enumerate(_DATE_PATTERNS):
+                    match = pattern.search(date_str)
+                    if match:
+                        date_groups = match.groups()
+                        date_format = i
+                        break
 
-            if date_match:
+            if date_groups:
                 if date_format in [0, 1, 3]:  # M/D/YY, M-D-YY, M.D.YY
-                    month, day, year = date_match.groups()
+                    month, day, year = date_groups
                 else:  # YYYY/MM/DD format
-                    year, month, day = date_match.groups()
+                    year, month, day = date_groups
 
                 # Convert to integers
                 month = int(month)
                 day = int(day)
                 year = int(year)
 
+                # One clock read serves both the century guess and the future-date check
+                current_date = datetime.now()
+
                 # Enhanced year handling
                 if year < 100:
-                    current_year = datetime.now().year
+                    current_year = current_date.year
                     current_century = current_year // 100 * 100
                     current_2digit = current_year % 100
 
@@ -295,23 +677,16 @@ class MPesaParser:
                 hour, minute = 0, 0  # Default values
 
                 if time_str:
-                    time_patterns = [
-                        r'(\d{1,2}):(\d{2})\s*(AM|PM)',     # 7:43 AM or 11:51 PM
-                        r'(\d{1,2}):(\d{2}):(\d{2})\s*(AM|PM)',  # 7:43:00 AM
-                        r'(\d{1,2}):(\d{2})',               # 24-hour format 07:43
-                        r'(\d{1,2})\.(\d{2})',              # Alternative format 7.43
-                        r'(\d{1,2})(\d{2})\s*(AM|PM)',      # 743 AM (no colon)
-                    ]
-
-                    time_match = None
-                    for pattern in time_patterns:
-                        match = re.search(pattern, time_str.upper())
-                        if match:
-                            time_match = match
-                            break
-
-                    if time_match:
-                        groups = time_match.groups()
+                    time_upper = time_str.upper()
+                    groups = _split_clock_time(time_upper)
+                    if groups is None:
+                        for pattern in _TIME_PATTERNS:
+                            match = pattern.search(time_upper)
+                            if match:
+                                groups = match.groups()
+                                break
+
+                    if groups:
                         hour = int(groups[0])
                         minute = int(groups[1])
 
@@ -320,11 +695,11 @@ class MPesaParser:
                             # Skip seconds for simplicity
                             pass
 
-                        # Handle AM/PM conversion
+                        # Handle AM/PM conversion (groups come from the upper-cased time)
                         am_pm = None
                         for group in groups:
-                            if group and group.upper() in ['AM', 'PM']:
-                                am_pm = group.upper()
+                            if group in ('AM', 'PM'):
+                                am_pm = group
                                 break
 
                         if am_pm:
@@ -348,7 +723,6 @@ class MPesaParser:
                         date_obj = datetime(year, month, day, hour, minute)
 
                         # Additional validation: not too far in the future
-                        current_date = datetime.now()
                         if date_obj > current_date + timedelta(days=365):
                             # If date is more than a year in the future, assume wrong year interpretation
                             if year >= 2000:
@@ -374,22 +748,8 @@ class MPesaParser:
         Extract transaction date directly from message without separate date/time parameters
         Useful for messages where date and time are embedded differently
         """
-        # Enhanced patterns to find date-time in message
-        date_time_patterns = [
-            # "on 6/10/25 at 7:43 AM"
-            r'on\s+(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s+at\s+(\d{1,2}:\d{2}\s*(?:AM|PM)?)',
-            # "6/10/25 at 7:43 AM"
-            r'(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s+at\s+(\d{1,2}:\d{2}\s*(?:AM|PM)?)',
-            # "6/10/25 7:43 AM" (no "at")
-            r'(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s+(\d{1,2}:\d{2}\s*(?:AM|PM)?)',
-            # Just date "on 6/10/25"
-            r'on\s+(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})',
-            # Timestamp format "2025-10-06T19:43:00"
-            r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})',
-        ]
-
-        for pattern in date_time_patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
+        for pattern in _MESSAGE_DATE_TIME_PATTERNS:
+            match = pattern.search(message)
             if match:
                 if len(match.groups()) == 2:
                     return cls.parse_transaction_date(match.group(1), match.group(2))
@@ -406,148 +766,50 @@ class MPesaParser:
         return None
     
     @classmethod
-    def determine_transaction_type(cls, message: str, pattern_type: str) -> str:
+    def determine_transaction_type(cls, message: str, pattern_type: str,
+                                   message_lower: Optional[str] = None) -> str:
         """
         Determine if transaction is income or expense based on message content
         """
-        message_lower = message.lower()
+        if message_lower is None:
+            message_lower = message.lower()
 
         # Income indicators
         if pattern_type in ['received', 'fuliza_loan'] or any(word in message_lower for word in ['received', 'deposited', 'refund']):
             return 'income'
 
-        # Expense indicators
-        if pattern_type in ['fuliza_repayment'] or any(word in message_lower for word in ['sent', 'paid', 'withdrawn', 'purchased', 'bought', 'repay']):
-            return 'expense'
-
-        # Default to expense for ambiguous cases
+        # Everything else is an expense: explicit expense indicators (sent, paid,
+        # withdrawn, purchased, bought, repay) and ambiguous cases alike
         return 'expense'
     
     @classmethod
-    def categorize_mpesa_transaction(cls, message: str, recipient: str = None) -> str:
+    def categorize_mpesa_transaction(cls, message: str, recipient: str = None,
+                                     message_lower: Optional[str] = None) -> str:
         """
         Enhanced auto-categorization based on message content and recipient
         Includes comprehensive Kenyan service providers and paybill numbers
         """
-        message_lower = message.lower()
+        if message_lower is None:
+            message_lower = message.lower()
         recipient_lower = (recipient or "").lower()
         combined_text = message_lower + " " + recipient_lower
 
         # Extract paybill number for specific categorization
-        paybill_match = re.search(r'paybill\s+(\d+)', combined_text)
+        paybill_match = _RE_PAYBILL_NUMBER.search(combined_text)
         paybill_number = paybill_match.group(1) if paybill_match else None
 
-        # Known Kenyan Utility Paybill Numbers
-        utility_paybills = {
-            '888880': 'Utilities',  # KPLC Prepaid
-            '888888': 'Utilities',  # KPLC Postpaid
-            '444400': 'Utilities',  # Nairobi Water
-            '895500': 'Utilities',  # Mombasa Water
-            '517000': 'Utilities',  # Kisumu Water
-            '111444': 'Utilities',  # Nakuru Water
-            '511000': 'Utilities',  # Eldoret Water
-            '885100': 'Utilities',  # Kiambu Water
-            '880600': 'Utilities',  # Garissa Water
-            '363100': 'Utilities',  # Mavoko Water
-            '200200': 'Telecommunications',  # Safaricom
-        }
-
         # Check paybill number first for exact matches
-        if paybill_number and paybill_number in utility_paybills:
-            return utility_paybills[paybill_number]
+        if paybill_number and paybill_number in cls.UTILITY_PAYBILLS:
+            return cls.UTILITY_PAYBILLS[paybill_number]
 
         # Fuliza (Loans & Credit)
         if 'fuliza' in combined_text:
             return 'Loans & Credit'
 
-        # Enhanced Utilities categorization
-        utility_keywords = [
-            # Electricity
-            'kplc', 'kenya power', 'electricity', 'prepaid', 'postpaid', 'power',
-            # Water
-            'water', 'nairobi water', 'mombasa water', 'kisumu water', 'nakuru water',
-            'eldoret water', 'kiambu water', 'garissa water', 'mavoko water', 'ncwsc',
-            # Telecommunications & Internet
-            'safaricom', 'airtel', 'telkom', 'data bundles', 'airtime', 'bundles',
-            'internet', 'wifi', 'broadband', 'faiba', 'zuku', 'wananchi',
-            # Gas
-            'gas', 'lpg', 'cooking gas'
-        ]
-        if any(keyword in combined_text for keyword in utility_keywords):
-            return 'Utilities'
-
-        # Enhanced Transportation
-        transport_keywords = [
-            'uber', 'bolt', 'taxi', 'matatu', 'boda', 'boda boda', 'fuel', 'petrol',
-            'parking', 'transport', 'bus', 'travel', 'fare', 'sgr', 'railway',
-            'kenya airways', 'jambojet', 'fly540', 'flight', 'airline'
-        ]
-        if any(keyword in combined_text for keyword in transport_keywords):
-            return 'Transport'
-
-        # Food & Dining
-        food_keywords = [
-            'restaurant', 'hotel', 'food', 'cafe', 'kitchen', 'meal',
-            'lunch', 'dinner', 'breakfast', 'snack', 'delivery', 'takeaway',
-            'kfc', 'pizza', 'subway', 'java', 'artcaffe', 'chicken inn'
-        ]
-        if any(keyword in combined_text for keyword in food_keywords):
-            return 'Food & Dining'
-
-        # Enhanced Shopping
-        shopping_keywords = [
-            'shop', 'store', 'market', 'supermarket', 'mall', 'outlet',
-            'retail', 'purchase', 'buy', 'nakumatt', 'tuskys', 'carrefour',
-            'naivas', 'chandarana', 'quickmart', 'cleanshelf', 'eastmatt'
-        ]
-        if any(keyword in combined_text for keyword in shopping_keywords):
-            return 'Shopping'
-
-        # Health & Medical
-        health_keywords = [
-            'hospital', 'clinic', 'pharmacy', 'medical', 'doctor', 'health',
-            'medicine', 'treatment', 'consultation', 'nhif', 'aga khan',
-            'nairobi hospital', 'kenyatta hospital', 'mater hospital'
-        ]
-        if any(keyword in combined_text for keyword in health_keywords):
-            return 'Health'
-
-        # Education
-        education_keywords = [
-            'school', 'university', 'college', 'education', 'tuition',
-            'fees', 'academic', 'learning', 'course', 'uon', 'ku', 'mku',
-            'strathmore', 'usiu', 'kabarak'
-        ]
-        if any(keyword in combined_text for keyword in education_keywords):
-            return 'Education'
-
-        # Entertainment & Recreation
-        entertainment_keywords = [
-            'cinema', 'movie', 'game', 'sport', 'entertainment', 'music',
-            'concert', 'show', 'theatre', 'fun', 'betting', 'sportpesa',
-            'betin', 'mcheza', 'club', 'disco'
-        ]
-        if any(keyword in combined_text for keyword in entertainment_keywords):
-            return 'Entertainment'
-
-        # Enhanced Banks & Financial Services
-        financial_keywords = [
-            'bank', 'equity', 'kcb', 'cooperative', 'barclays', 'standard chartered',
-            'family bank', 'gt bank', 'loan', 'credit', 'savings', 'account',
-            'ncba', 'diamond trust', 'i&m bank', 'housing finance', 'sidian bank',
-            'centum', 'sacco'
-        ]
-        if any(keyword in combined_text for keyword in financial_keywords):
-            return 'Financial Services'
-
-        # Government & Official Services
-        government_keywords = [
-            'government', 'ministry', 'county', 'kra', 'nhif', 'nssf',
-            'huduma', 'license', 'permit', 'registration', 'ntsa', 'lands',
-            'attorney general', 'court', 'police', 'immigration'
-        ]
-        if any(keyword in combined_text for keyword in government_keywords):
-            return 'Government & Services'
+        # Keyword categories, highest priority first
+        category = cls._match_category_keywords(combined_text)
+        if category:
+            return category
 
         # Personal transfers (enhanced detection)
         if recipient and len(recipient.split()) >= 2:
@@ -560,244 +822,320 @@ class MPesaParser:
                 return 'Personal Transfer'
 
         # Bills & Fees for paybill/till transactions (fallback)
-        if any(keyword in combined_text for keyword in ['paybill', 'till', 'bill payment']):
+        if any(keyword in combined_text for keyword in cls.BILL_KEYWORDS):
             return 'Bills & Fees'
 
         # Default category
         return 'Other'
     
+    @classmethod
+    def _match_category_keywords(cls, text: str) -> Optional[str]:
+        """
+        Return the highest-priority keyword category present in the text, if any
+        """
+        if cls._CATEGORY_AUTOMATON is not None:
+            # Single scan over the text; keep the best priority among all hits
+            best = None
+            for _, (priority, category) in cls._CATEGORY_AUTOMATON.iter(text):
+                if best is None or priority < best[0]:
+                    best = (priority, category)
+                    if priority == 0:
+                        break
+            return best[1] if best else None
+
+        for category, keywords in cls.CATEGORY_KEYWORDS:
+            if any(keyword in text for keyword in keywords):
+                return category
+        return None
+
     @classmethod
     def parse_message(cls, message: str) -> Optional[Dict[str, Any]]:
         """
         Parse M-Pesa SMS message and extract transaction details
+
+        Parses are cached by message text, since the same SMS is commonly
+        re-ingested (retries, duplicate checks, import re-runs). Each call gets
+        its own copy of the result with a fresh parsed_at timestamp.
         """
         if not message or not message.strip():
             return None
 
-        if not cls.is_mpesa_message(message):
+        parsed = cls._parse_message_cached(message)
+        if parsed is None:
+            return None
+
+        result = _copy_parse_result(parsed)
+        if result.get('sms_metadata'):
+            result['sms_metadata']['parsed_at'] = datetime.now().isoformat()
+        return result
+
+    @classmethod
+    def parse_messages(cls, messages: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Parse a batch of SMS messages (e.g. an SMS backup import)
+
+        Results line up with the input; messages that aren't M-Pesa transactions
+        give None. Each distinct body is parsed once and repeats are served from
+        the parse cache.
+        """
+        parse_message = cls.parse_message
+        return [parse_message(message) for message in messages]
+
+    @classmethod
+    def clear_parse_cache(cls) -> None:
+        """
+        Drop all cached parse and phone number results
+        """
+        cls._parse_message_cached.cache_clear()
+        cls._format_phone_number.cache_clear()
+
+    @classmethod
+    @functools.lru_cache(maxsize=4096)
+    def _parse_message_cached(cls, message: str) -> Optional[Dict[str, Any]]:
+        """
+        Uncached parse of a message; results are shared and must not be mutated
+        """
+        # Lower-cased once for detection, normalization and all the keyword checks
+        message_lower = message.lower()
+        if not cls.is_mpesa_message(message, message_lower):
             return None
         
         original_message = message
-        normalized_message = cls.normalize_message(message)
+        normalized_message = cls.normalize_message(message, message_lower)
         
-        # Try each pattern type in order of specificity (most specific first)
-        pattern_order = [
-            'compound_received_fuliza',  # Most specific - compound transactions
-            'fuliza_loan',               # Fuliza loans
-            'fuliza_repayment',          # Fuliza repayments
-            'modern_sent',               # Modern sent transactions
-            'modern_received',           # Modern received transactions
-            'received',                  # Legacy received
-            'sent',                      # Legacy sent
-            'withdrawal',                # Withdrawals
-            'airtime',                   # Airtime purchases
-            'paybill',                   # Paybill payments
-            'till'                       # Till payments
-        ]
+        # Try each pattern in order of specificity (most specific first)
+        for pattern_type, required_text, pattern in cls._ORDERED_PATTERNS:
+            if required_text not in normalized_message:
+                continue
+            match = pattern.search(normalized_message)
+            if match:
+                return cls._extract_transaction_details(
+                    original_message, normalized_message, match, pattern_type, message_lower
+                )
 
-        # Try patterns in specific order first
-        for pattern_type in pattern_order:
-            if pattern_type in cls.PATTERNS:
-                patterns = cls.PATTERNS[pattern_type]
-                for pattern in patterns:
-                    match = re.search(pattern, normalized_message, re.IGNORECASE)
-                    if match:
-                        return cls._extract_transaction_details(
-                            original_message, normalized_message, match, pattern_type
-                        )
-
-        # Try remaining patterns if no specific match found
-        for pattern_type, patterns in cls.PATTERNS.items():
-            if pattern_type not in pattern_order:
-                for pattern in patterns:
-                    match = re.search(pattern, normalized_message, re.IGNORECASE)
-                    if match:
-                        return cls._extract_transaction_details(
-                            original_message, normalized_message, match, pattern_type
-                        )
-        
         # If no pattern matches but it's clearly an M-Pesa message, try generic extraction
-        return cls._generic_extraction(original_message, normalized_message)
+        return cls._generic_extraction(original_message, normalized_message, message_lower)
     
     @classmethod
-    def _extract_transaction_details(cls, original_message: str, normalized_message: str,
-                                   match: re.Match, pattern_type: str) -> Dict[str, Any]:
+    def _find_transaction_date(cls, original_message: str) -> Optional[str]:
         """
-        Extract transaction details from regex match
+        Parse the "on <date> at <time>" part of the original message, if present
         """
-        groups = match.groups()
-
-        # Initialize variables
-        amount = None
-        recipient = None
-        phone_number = None
-        reference = None
-        balance_after = None
-        transaction_id = None
-        transaction_fee = None
-        access_fee = None
-        fuliza_limit = None
-        fuliza_outstanding = None
-        due_date = None
-
-        # Initialize transaction_date
-        transaction_date = None
-
-        # Extract data based on pattern type
-        if pattern_type == 'modern_sent':
-            transaction_id = groups[0].strip() if len(groups) > 0 and groups[0] else None
-            amount = cls.extract_amount(groups[1]) if len(groups) > 1 and groups[1] else None
-            recipient = cls.clean_recipient_name(groups[2]) if len(groups) > 2 and groups[2] else None
-
-            # Handle different pattern variations based on the specific pattern matched
-            if len(groups) >= 8 and groups[4] and groups[5]:  # Full pattern with account and date
-                reference = groups[3] if groups[3] else None
-                transaction_date = cls.parse_transaction_date(groups[4], groups[5]) if groups[4] and groups[5] else None
-                balance_after = cls.extract_amount(groups[6]) if groups[6] else None
-                transaction_fee = cls.extract_amount(groups[7]) if groups[7] else None
-            elif len(groups) >= 6 and groups[3] and groups[4]:  # Pattern with date but might not have account in expected position
-                # Check if groups[3] and groups[4] look like date and time
-                if '/' in str(groups[3]) and (':' in str(groups[4]) or 'AM' in str(groups[4]) or 'PM' in str(groups[4])):
-                    reference = None
-                    transaction_date = cls.parse_transaction_date(groups[3], groups[4]) if groups[3] and groups[4] else None
-                    balance_after = cls.extract_amount(groups[5]) if len(groups) > 5 and groups[5] else None
-                    transaction_fee = cls.extract_amount(groups[6]) if len(groups) > 6 and groups[6] else None
-                else:
-                    # groups[3] might be account reference, look for date later
-                    reference = groups[3] if groups[3] else None
-                    # Try to find date/time in the original message
-                    date_time_match = re.search(r'on\s+([0-9/\-]+)\s+at\s+([0-9:]+\s*(?:AM|PM)?)', original_message, re.IGNORECASE)
-                    transaction_date = cls.parse_transaction_date(date_time_match.group(1), date_time_match.group(2)) if date_time_match else None
-                    balance_after = cls.extract_amount(groups[4]) if len(groups) > 4 and groups[4] else None
-                    transaction_fee = cls.extract_amount(groups[5]) if len(groups) > 5 and groups[5] else None
+        date_time_match = _RE_ON_DATE_AT_TIME.search(original_message)
+        if not date_time_match:
+            return None
+        return cls.parse_transaction_date(date_time_match.group(1), date_time_match.group(2))
+
+    @classmethod
+    def _extract_modern_sent(cls, groups: Tuple, original_message: str) -> Dict[str, Any]:
+        g = groups + cls._GROUP_PADDING
+        details = {
+            'transaction_id': g[0].strip() if g[0] else None,
+            'amount': cls.extract_amount(g[1]),
+            'recipient': cls.clean_recipient_name(g[2]) if g[2] else None,
+        }
+
+        # Handle different pattern variations based on the specific pattern matched
+        if len(groups) >= 8 and g[4] and g[5]:  # Full pattern with account and date
+            details['reference'] = g[3] or None
+            details['transaction_date'] = cls.parse_transaction_date(g[4], g[5])
+            details['balance_after'] = cls.extract_amount(g[6])
+            details['transaction_fee'] = cls.extract_amount(g[7])
+        elif len(groups) >= 6 and g[3] and g[4]:  # Pattern with date but might not have account in expected position
+            # Check if groups[3] and groups[4] look like date and time
+            if '/' in g[3] and (':' in g[4] or 'AM' in g[4] or 'PM' in g[4]):
+                details['transaction_date'] = cls.parse_transaction_date(g[3], g[4])
+                details['balance_after'] = cls.extract_amount(g[5])
+                details['transaction_fee'] = cls.extract_amount(g[6])
             else:
-                # Fallback: try to extract date/time from the original message regardless of groups
-                reference = None
-                date_time_match = re.search(r'on\s+([0-9/\-]+)\s+at\s+([0-9:]+\s*(?:AM|PM)?)', original_message, re.IGNORECASE)
-                transaction_date = cls.parse_transaction_date(date_time_match.group(1), date_time_match.group(2)) if date_time_match else None
-                balance_after = cls.extract_amount(groups[3]) if len(groups) > 3 and groups[3] else None
-                transaction_fee = None
-
-        elif pattern_type == 'modern_received':
-            transaction_id = groups[0].strip() if len(groups) > 0 and groups[0] else None
-            amount = cls.extract_amount(groups[1]) if len(groups) > 1 and groups[1] else None
-            recipient = cls.clean_recipient_name(groups[2]) if len(groups) > 2 and groups[2] else None
-
-            # Handle different pattern variations for received messages
-            if len(groups) >= 7 and groups[4] and groups[5]:  # Full pattern with account number and date
-                reference = groups[3] if groups[3] else None  # Account number
-                transaction_date = cls.parse_transaction_date(groups[4], groups[5]) if groups[4] and groups[5] else None
-                balance_after = cls.extract_amount(groups[6]) if groups[6] else None
-            elif len(groups) >= 5:  # Pattern might have date
-                # Check if groups[3] and groups[4] look like date and time
-                if groups[3] and groups[4] and '/' in str(groups[3]) and (':' in str(groups[4]) or 'AM' in str(groups[4]) or 'PM' in str(groups[4])):
-                    reference = None
-                    transaction_date = cls.parse_transaction_date(groups[3], groups[4]) if groups[3] and groups[4] else None
-                    balance_after = cls.extract_amount(groups[5]) if len(groups) > 5 and groups[5] else None
-                else:
-                    # Try to find date/time in the original message
-                    reference = groups[3] if groups[3] and groups[3].isdigit() else None  # Account number if numeric
-                    date_time_match = re.search(r'on\s+([0-9/\-]+)\s+at\s+([0-9:]+\s*(?:AM|PM)?)', original_message, re.IGNORECASE)
-                    transaction_date = cls.parse_transaction_date(date_time_match.group(1), date_time_match.group(2)) if date_time_match else None
-                    balance_after = cls.extract_amount(groups[4]) if len(groups) > 4 and groups[4] else None
+                # groups[3] might be account reference, look for date later
+                details['reference'] = g[3]
+                details['transaction_date'] = cls._find_transaction_date(original_message)
+                details['balance_after'] = cls.extract_amount(g[4])
+                details['transaction_fee'] = cls.extract_amount(g[5])
+        else:
+            # Fallback: try to extract date/time from the original message regardless of groups
+            details['transaction_date'] = cls._find_transaction_date(original_message)
+            details['balance_after'] = cls.extract_amount(g[3])
+        return details
+
+    @classmethod
+    def _extract_modern_received(cls, groups: Tuple, original_message: str) -> Dict[str, Any]:
+        g = groups + cls._GROUP_PADDING
+        details = {
+            'transaction_id': g[0].strip() if g[0] else None,
+            'amount': cls.extract_amount(g[1]),
+            'recipient': cls.clean_recipient_name(g[2]) if g[2] else None,
+        }
+
+        # Handle different pattern variations for received messages
+        if len(groups) >= 7 and g[4] and g[5]:  # Full pattern with account number and date
+            details['reference'] = g[3] or None  # Account number
+            details['transaction_date'] = cls.parse_transaction_date(g[4], g[5])
+            details['balance_after'] = cls.extract_amount(g[6])
+        elif len(groups) >= 5:  # Pattern might have date
+            # Check if groups[3] and groups[4] look like date and time
+            if g[3] and g[4] and '/' in g[3] and (':' in g[4] or 'AM' in g[4] or 'PM' in g[4]):
+                details['transaction_date'] = cls.parse_transaction_date(g[3], g[4])
+                details['balance_after'] = cls.extract_amount(g[5])
             else:
-                # Fallback: try to extract date/time from the original message regardless of groups
-                reference = None
-                date_time_match = re.search(r'on\s+([0-9/\-]+)\s+at\s+([0-9:]+\s*(?:AM|PM)?)', original_message, re.IGNORECASE)
-                transaction_date = cls.parse_transaction_date(date_time_match.group(1), date_time_match.group(2)) if date_time_match else None
-                balance_after = cls.extract_amount(groups[3]) if len(groups) > 3 and groups[3] else None
-
-        elif pattern_type == 'fuliza_loan':
-            transaction_id = groups[0].strip() if len(groups) > 0 and groups[0] else None
-            amount = cls.extract_amount(groups[1]) if len(groups) > 1 and groups[1] else None
-            access_fee = cls.extract_amount(groups[2]) if len(groups) > 2 and groups[2] else None
-            fuliza_outstanding = cls.extract_amount(groups[3]) if len(groups) > 3 and groups[3] else None
-            due_date = groups[4].strip() if len(groups) > 4 and groups[4] else None
-            balance_after = cls.extract_amount(groups[5]) if len(groups) > 5 and groups[5] else None
-            recipient = "Fuliza M-PESA Loan"
+                # Try to find date/time in the original message
+                details['reference'] = g[3] if g[3] and g[3].isdigit() else None  # Account number if numeric
+                details['transaction_date'] = cls._find_transaction_date(original_message)
+                details['balance_after'] = cls.extract_amount(g[4])
+        else:
+            # Fallback: try to extract date/time from the original message regardless of groups
+            details['transaction_date'] = cls._find_transaction_date(original_message)
+            details['balance_after'] = cls.extract_amount(g[3])
+        return details
 
-        elif pattern_type == 'fuliza_repayment':
-            transaction_id = groups[0].strip() if len(groups) > 0 and groups[0] else None
-            amount = cls.extract_amount(groups[1]) if len(groups) > 1 and groups[1] else None
+    @classmethod
+    def _extract_fuliza_loan(cls, groups: Tuple, original_message: str) -> Dict[str, Any]:
+        g = groups + cls._GROUP_PADDING
+        return {
+            'transaction_id': g[0].strip() if g[0] else None,
+            'amount': cls.extract_amount(g[1]),
+            'access_fee': cls.extract_amount(g[2]),
+            'fuliza_outstanding': cls.extract_amount(g[3]),
+            'due_date': g[4].strip() if g[4] else None,
+            'balance_after': cls.extract_amount(g[5]),
+            'recipient': "Fuliza M-PESA Loan",
+        }
+
+    @classmethod
+    def _extract_fuliza_repayment(cls, groups: Tuple, original_message: str) -> Dict[str, Any]:
+        g = groups + cls._GROUP_PADDING
+        details = {
+            'transaction_id': g[0].strip() if g[0] else None,
+            'amount': cls.extract_amount(g[1]),
+            'recipient': "Fuliza M-PESA Repayment",
+        }
+        if len(groups) >= 4:
+            details['fuliza_limit'] = cls.extract_amount(g[2])
+            details['balance_after'] = cls.extract_amount(g[3])
+        return details
 
-            # Handle different fuliza repayment patterns
-            if len(groups) >= 4:
-                fuliza_limit = cls.extract_amount(groups[2]) if groups[2] else None
-                balance_after = cls.extract_amount(groups[3]) if groups[3] else None
-            elif len(groups) >= 5:  # For the alternative pattern
-                fuliza_outstanding = cls.extract_amount(groups[2]) if groups[2] else None
-                fuliza_limit = cls.extract_amount(groups[3]) if groups[3] else None
-                balance_after = cls.extract_amount(groups[4]) if groups[4] else None
+    @classmethod
+    def _extract_compound_received_fuliza(cls, groups: Tuple, original_message: str) -> Dict[str, Any]:
+        # User received money + automatic Fuliza deduction. The main transaction is
+        # the money received; the Fuliza deduction is only reflected in the limit
+        g = groups + cls._GROUP_PADDING
+        return {
+            'transaction_id': g[0].strip() if g[0] else None,
+            'amount': cls.extract_amount(g[1]),
+            'recipient': cls.clean_recipient_name(g[2]) if g[2] else None,
+            'reference': g[3] if g[3] and g[3].isdigit() else None,
+            'fuliza_limit': cls.extract_amount(g[5]),
+            'balance_after': cls.extract_amount(g[6]),
+        }
 
-            recipient = "Fuliza M-PESA Repayment"
+    @classmethod
+    def _extract_received(cls, groups: Tuple, original_message: str) -> Dict[str, Any]:
+        g = groups + cls._GROUP_PADDING
+        return {
+            'amount': cls.extract_amount(g[0]),
+            'recipient': cls.clean_recipient_name(g[1]) if g[1] else None,
+            'phone_number': cls.extract_phone_number(g[2]) if g[2] else None,
+            'balance_after': cls.extract_amount(g[3]),
+            'transaction_id': g[4].strip() if g[4] else None,
+        }
 
-        elif pattern_type == 'compound_received_fuliza':
-            # This is a complex transaction: user received money + automatic Fuliza deduction
-            transaction_id = groups[0].strip() if len(groups) > 0 and groups[0] else None
-            received_amount = cls.extract_amount(groups[1]) if len(groups) > 1 and groups[1] else None
-            sender = cls.clean_recipient_name(groups[2]) if len(groups) > 2 and groups[2] else None
-            reference = groups[3] if len(groups) > 3 and groups[3] and groups[3].isdigit() else None
-            fuliza_deduction = cls.extract_amount(groups[4]) if len(groups) > 4 and groups[4] else None
-            fuliza_limit = cls.extract_amount(groups[5]) if len(groups) > 5 and groups[5] else None
-            balance_after = cls.extract_amount(groups[6]) if len(groups) > 6 and groups[6] else None
-
-            # For compound transactions, we treat the main transaction as receiving money
-            # The Fuliza deduction will be recorded in the metadata
-            amount = received_amount
-            recipient = sender
-
-            # Store Fuliza deduction details
-            fuliza_outstanding = None  # Could be calculated: previous_outstanding - fuliza_deduction
-
-            # Add note about automatic deduction in description - this will be used later
-            # Store deduction info in metadata for the description generation
-
-        elif pattern_type == 'received':
-            amount = cls.extract_amount(groups[0]) if len(groups) > 0 and groups[0] else None
-            recipient = cls.clean_recipient_name(groups[1]) if len(groups) > 1 and groups[1] else None
-            phone_number = cls.extract_phone_number(groups[2]) if len(groups) > 2 and groups[2] else None
-            balance_after = cls.extract_amount(groups[3]) if len(groups) > 3 and groups[3] else None
-            transaction_id = groups[4].strip() if len(groups) > 4 and groups[4] else None
-
-        elif pattern_type in ['sent', 'paybill', 'till']:
-            amount = cls.extract_amount(groups[0]) if len(groups) > 0 and groups[0] else None
-            recipient = cls.clean_recipient_name(groups[1]) if len(groups) > 1 and groups[1] else None
-            if pattern_type == 'paybill':
-                reference = groups[2] if len(groups) > 2 and groups[2] else None
-                balance_after = cls.extract_amount(groups[4]) if len(groups) > 4 and groups[4] else None
-                transaction_id = groups[5].strip() if len(groups) > 5 and groups[5] else None
-            else:
-                balance_after = cls.extract_amount(groups[2]) if len(groups) > 2 and groups[2] else None
-                # Try to extract transaction cost/fee from the message
-                fee_match = re.search(r'transaction cost[:\s,]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)', original_message, re.IGNORECASE)
-                if fee_match:
-                    transaction_fee = cls.extract_amount(fee_match.group(1))
-                transaction_id = groups[3].strip() if len(groups) > 3 and groups[3] else None
+    @classmethod
+    def _extract_sent(cls, groups: Tuple, original_message: str) -> Dict[str, Any]:
+        # Legacy sent and till payments
+        g = groups + cls._GROUP_PADDING
+        details = {
+            'amount': cls.extract_amount(g[0]),
+            'recipient': cls.clean_recipient_name(g[1]) if g[1] else None,
+            'balance_after': cls.extract_amount(g[2]),
+            'transaction_id': g[3].strip() if g[3] else None,
+        }
+        # Try to extract transaction cost/fee from the message
+        fee_match = _RE_TRANSACTION_COST.search(original_message)
+        if fee_match:
+            details['transaction_fee'] = cls.extract_amount(fee_match.group(1))
+        return details
 
-        elif pattern_type == 'withdrawal':
-            amount = cls.extract_amount(groups[0]) if len(groups) > 0 and groups[0] else None
-            recipient = cls.clean_recipient_name(groups[1]) if len(groups) > 1 and groups[1] else None
-            balance_after = cls.extract_amount(groups[2]) if len(groups) > 2 and groups[2] else None
-            transaction_id = groups[3].strip() if len(groups) > 3 and groups[3] else None
+    @classmethod
+    def _extract_paybill(cls, groups: Tuple, original_message: str) -> Dict[str, Any]:
+        g = groups + cls._GROUP_PADDING
+        return {
+            'amount': cls.extract_amount(g[0]),
+            'recipient': cls.clean_recipient_name(g[1]) if g[1] else None,
+            'reference': g[2] or None,
+            'balance_after': cls.extract_amount(g[4]),
+            'transaction_id': g[5].strip() if g[5] else None,
+        }
 
-        elif pattern_type == 'airtime':
-            amount = cls.extract_amount(groups[0]) if len(groups) > 0 and groups[0] else None
-            phone_number = cls.extract_phone_number(groups[1]) if len(groups) > 1 and groups[1] else None
-            recipient = f"Airtime for {phone_number}" if phone_number else "Airtime Purchase"
-            balance_after = cls.extract_amount(groups[2]) if len(groups) > 2 and groups[2] else None
-            transaction_id = groups[3].strip() if len(groups) > 3 and groups[3] else None
+    @classmethod
+    def _extract_withdrawal(cls, groups: Tuple, original_message: str) -> Dict[str, Any]:
+        g = groups + cls._GROUP_PADDING
+        return {
+            'amount': cls.extract_amount(g[0]),
+            'recipient': cls.clean_recipient_name(g[1]) if g[1] else None,
+            'balance_after': cls.extract_amount(g[2]),
+            'transaction_id': g[3].strip() if g[3] else None,
+        }
+
+    @classmethod
+    def _extract_airtime(cls, groups: Tuple, original_message: str) -> Dict[str, Any]:
+        g = groups + cls._GROUP_PADDING
+        phone_number = cls.extract_phone_number(g[1]) if g[1] else None
+        return {
+            'amount': cls.extract_amount(g[0]),
+            'phone_number': phone_number,
+            'recipient': f"Airtime for {phone_number}" if phone_number else "Airtime Purchase",
+            'balance_after': cls.extract_amount(g[2]),
+            'transaction_id': g[3].strip() if g[3] else None,
+        }
+
+    @classmethod
+    def _extract_transaction_details(cls, original_message: str, normalized_message: str,
+                                   match: re.Match, pattern_type: str,
+                                   message_lower: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Extract transaction details from regex match
+        """
+        # Extract data based on pattern type; fields an extractor doesn't produce stay None
+        details = dict.fromkeys(cls._DETAIL_FIELDS)
+        extractor = cls._EXTRACTORS.get(pattern_type)
+        if extractor:
+            details.update(getattr(cls, extractor)(match.groups(), original_message))
+
+        amount = details['amount']
+        recipient = details['recipient']
+        phone_number = details['phone_number']
+        reference = details['reference']
+        balance_after = details['balance_after']
+        transaction_id = details['transaction_id']
+        transaction_fee = details['transaction_fee']
+        access_fee = details['access_fee']
+        fuliza_limit = details['fuliza_limit']
+        fuliza_outstanding = details['fuliza_outstanding']
+        due_date = details['due_date']
+        transaction_date = details['transaction_date']
+
+        # Lower-cased once for all the keyword checks below
+        if message_lower is None:
+            message_lower = original_message.lower()
 
         # Determine transaction type
-        transaction_type = cls.determine_transaction_type(original_message, pattern_type)
+        transaction_type = cls.determine_transaction_type(original_message, pattern_type, message_lower)
 
         # Generate description
         description = cls._generate_description(pattern_type, recipient, amount, reference)
 
         # Auto-categorize
-        suggested_category = cls.categorize_mpesa_transaction(original_message, recipient)
+        suggested_category = cls.categorize_mpesa_transaction(original_message, recipient, message_lower)
 
-        # Enhanced fee extraction from the original message
-        enhanced_fees = cls._extract_all_fees(original_message)
+        # Enhanced fee extraction from the original message; fee types the
+        # pattern already captured would be discarded by the merge, so skip them
+        known_fees = []
+        if transaction_fee is not None:
+            known_fees.append('transaction_fee')
+        if access_fee is not None:
+            known_fees.append('access_fee')
+        enhanced_fees = cls._extract_all_fees(original_message, message_lower, known_fees)
 
         # Merge extracted fees with pattern-based fees
         if transaction_fee is None and enhanced_fees.get('transaction_fee'):
@@ -805,26 +1143,27 @@ class MPesaParser:
         if access_fee is None and enhanced_fees.get('access_fee'):
             access_fee = enhanced_fees['access_fee']
 
-        # Calculate total fees
-        total_fees = 0
+        # Build the fee breakdown and total
         fee_breakdown = {}
 
         if transaction_fee:
-            total_fees += transaction_fee
             fee_breakdown['transaction_fee'] = transaction_fee
 
         if access_fee:
-            total_fees += access_fee
             fee_breakdown['access_fee'] = access_fee
 
         # Add any additional fees found
-        for fee_type, fee_amount in enhanced_fees.items():
-            if fee_type not in ['transaction_fee', 'access_fee'] and fee_amount > 0:
-                total_fees += fee_amount
-                fee_breakdown[fee_type] = fee_amount
+        fee_breakdown.update({
+            fee_type: fee_amount for fee_type, fee_amount in enhanced_fees.items()
+            if fee_type not in ('transaction_fee', 'access_fee') and fee_amount > 0
+        })
+        total_fees = sum(fee_breakdown.values())
 
         # Calculate parsing confidence with pattern type
-        confidence = cls._calculate_confidence(original_message, amount, recipient, transaction_id, pattern_type)
+        confidence = cls._calculate_confidence(original_message, amount, recipient, transaction_id, pattern_type,
+                                               message_lower)
+        message_hash = cls._hash_message(original_message)
+        requires_review = confidence < 0.8
 
         return {
             'amount': amount,
@@ -846,26 +1185,27 @@ class MPesaParser:
                 'due_date': due_date
             },
             'parsing_confidence': confidence,
-            'original_message_hash': cls._hash_message(original_message),
-            'requires_review': confidence < 0.8,
+            'original_message_hash': message_hash,
+            'requires_review': requires_review,
             'sms_metadata': {
                 'total_fees': total_fees if total_fees > 0 else None,
                 'fee_breakdown': fee_breakdown if fee_breakdown else None,
                 'parsing_confidence': confidence,
-                'original_message_hash': cls._hash_message(original_message),
-                'requires_review': confidence < 0.8,
+                'original_message_hash': message_hash,
+                'requires_review': requires_review,
                 'suggested_category': suggested_category,
                 'parsed_at': datetime.now().isoformat()
             }
         }
     
     @classmethod
-    def _generic_extraction(cls, original_message: str, normalized_message: str) -> Optional[Dict[str, Any]]:
+    def _generic_extraction(cls, original_message: str, normalized_message: str,
+                            message_lower: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Generic extraction for messages that don't match specific patterns
         """
         # Try to extract amount
-        amount_match = re.search(r'(?:ksh?|kes)\s*([0-9,]+(?:\.[0-9]{1,2})?)', normalized_message)
+        amount_match = _RE_GENERIC_AMOUNT.search(normalized_message)
         if not amount_match:
             return None
         
@@ -874,11 +1214,11 @@ class MPesaParser:
             return None
         
         # Try to extract transaction ID
-        transaction_id_match = re.search(r'(?:transaction|receipt|ref)[:\s]*([a-z0-9\-]{6,})', normalized_message)
+        transaction_id_match = _RE_GENERIC_TRANSACTION_ID.search(normalized_message)
         transaction_id = transaction_id_match.group(1).strip() if transaction_id_match and transaction_id_match.group(1) else None
         
         # Determine transaction type
-        transaction_type = cls.determine_transaction_type(original_message, 'generic')
+        transaction_type = cls.determine_transaction_type(original_message, 'generic', message_lower)
         
         return {
             'amount': amount,
@@ -910,13 +1250,7 @@ class MPesaParser:
             return f"Fuliza Repayment - KSh {amount:,.2f}"
         elif pattern_type in ['received', 'modern_received']:
             if recipient:
-                # Special handling for common senders
-                if 'equity' in recipient.lower():
-                    return f"Received from {recipient}"
-                elif 'bulk account' in recipient.lower():
-                    return f"Received from {recipient}"
-                else:
-                    return f"Received from {recipient}"
+                return f"Received from {recipient}"
             return "Money Received"
         elif pattern_type == 'compound_received_fuliza':
             # Special handling for compound transactions
@@ -926,17 +1260,18 @@ class MPesaParser:
         elif pattern_type in ['sent', 'modern_sent']:
             if recipient:
                 # Enhanced descriptions for common recipients
-                if 'kplc' in recipient.lower() or 'kenya power' in recipient.lower():
+                recipient_lower = recipient.lower()
+                if 'kplc' in recipient_lower or 'kenya power' in recipient_lower:
                     desc = f"Electricity Payment - {recipient}"
                     if reference:
                         desc += f" (Account: {reference})"
                     return desc
-                elif 'safaricom' in recipient.lower():
-                    if 'data' in recipient.lower():
+                elif 'safaricom' in recipient_lower:
+                    if 'data' in recipient_lower:
                         return f"Data Bundle Purchase - {recipient}"
                     else:
                         return f"Airtime Purchase - {recipient}"
-                elif 'water' in recipient.lower():
+                elif 'water' in recipient_lower:
                     desc = f"Water Bill Payment - {recipient}"
                     if reference:
                         desc += f" (Account: {reference})"
@@ -962,16 +1297,19 @@ class MPesaParser:
             return "M-Pesa Transaction"
     
     @classmethod
-    def _calculate_confidence(cls, message: str, amount: float, recipient: str, transaction_id: str, pattern_type: str = None) -> float:
+    def _calculate_confidence(cls, message: str, amount: float, recipient: str, transaction_id: str, pattern_type: str = None,
+                              message_lower: Optional[str] = None) -> float:
         """
         Enhanced confidence calculation for better accuracy assessment
         """
         confidence = 0.0
+        if message_lower is None:
+            message_lower = message.lower()
 
         # Base confidence for M-Pesa message (higher for modern formats)
-        if cls.is_mpesa_message(message):
+        if cls.is_mpesa_message(message, message_lower):
             # Higher confidence for modern transaction ID formats
-            if re.search(r'^[A-Z0-9]{6,12}\s+confirmed', message, re.IGNORECASE):
+            if _RE_TXID_CONFIRMED.match(message):
                 confidence += 0.4  # Modern format
             else:
                 confidence += 0.3  # Legacy format
@@ -994,7 +1332,7 @@ class MPesaParser:
         # Transaction ID quality
         if transaction_id and len(transaction_id.strip()) >= 6:
             # Modern transaction IDs are more reliable
-            if re.match(r'^[A-Z0-9]{8,12}$', transaction_id.strip()):
+            if _RE_QUALITY_TRANSACTION_ID.fullmatch(transaction_id.strip()):
                 confidence += 0.2  # Good quality transaction ID
             else:
                 confidence += 0.1  # Basic transaction ID
@@ -1004,8 +1342,6 @@ class MPesaParser:
             confidence += 0.1
 
         # Additional validation checks
-        message_lower = message.lower()
-
         # Check for balance information (increases confidence)
         if 'new m-pesa balance' in message_lower or 'balance is' in message_lower:
             confidence += 0.05
@@ -1014,160 +1350,38 @@ class MPesaParser:
         if 'transaction cost' in message_lower:
             confidence += 0.05
 
-        # Check for date/time information (increases confidence)
-        if re.search(r'\d{1,2}/\d{1,2}/\d{2,4}', message) and re.search(r'\d{1,2}:\d{2}\s*(?:AM|PM)', message, re.IGNORECASE):
+        # Check for date/time information (increases confidence); the literal
+        # separators rule out most undated messages before either regex runs
+        if '/' in message and ':' in message \
+                and _RE_SLASH_DATE.search(message) and _RE_CLOCK_TIME.search(message):
             confidence += 0.05
 
         return min(confidence, 1.0)
     
     @classmethod
-    def _extract_all_fees(cls, message: str) -> Dict[str, float]:
+    def _extract_all_fees(cls, message: str, message_lower: Optional[str] = None,
+                          skip_fee_types: Optional[List[str]] = None) -> Dict[str, float]:
         """
         Enhanced fee extraction to capture all possible fees from M-Pesa messages
         Improved to handle more fee types and edge cases
         """
         fees = {}
-        message_lower = message.lower()
-
-        # Enhanced transaction cost patterns (most common M-Pesa fees)
-        transaction_fee_patterns = [
-            r'transaction cost[:\s,]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'transaction fee[:\s,]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'mpesa fee[:\s,]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'charge[d]?[:\s,]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            # Handle "cost, Ksh0.00" format
-            r'cost[,\s]+(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-        ]
-
-        for pattern in transaction_fee_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                fee = cls.extract_amount(match.group(1))
-                if fee is not None and fee >= 0:  # Include zero fees for tracking
-                    fees['transaction_fee'] = fee
-                    break
-
-        # Enhanced access fee patterns (Fuliza specific)
-        access_fee_patterns = [
-            r'access fee charged[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'access fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'fuliza.*?fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'fuliza.*?charged[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-        ]
-
-        for pattern in access_fee_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                fee = cls.extract_amount(match.group(1))
-                if fee is not None and fee > 0:
-                    fees['access_fee'] = fee
-                    break
-
-        # Service fee patterns (bank transfers, etc.)
-        service_fee_patterns = [
-            r'service fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'service charge[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-        ]
-
-        for pattern in service_fee_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                fee = cls.extract_amount(match.group(1))
-                if fee is not None and fee > 0:
-                    fees['service_fee'] = fee
-                    break
-
-        # Processing fee patterns
-        processing_fee_patterns = [
-            r'processing fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'handling fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-        ]
-
-        for pattern in processing_fee_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                fee = cls.extract_amount(match.group(1))
-                if fee is not None and fee > 0:
-                    fees['processing_fee'] = fee
-                    break
-
-        # ATM and withdrawal fee patterns
-        atm_fee_patterns = [
-            r'atm fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'withdrawal fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'cash withdrawal fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-        ]
-
-        for pattern in atm_fee_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                fee = cls.extract_amount(match.group(1))
-                if fee is not None and fee > 0:
-                    fees['atm_fee'] = fee
-                    break
-
-        # Bank and agent charges
-        bank_charge_patterns = [
-            r'bank charge[s]?[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'agent fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'commission[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-        ]
-
-        for pattern in bank_charge_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                fee = cls.extract_amount(match.group(1))
-                if fee is not None and fee > 0:
-                    fees['bank_charge'] = fee
-                    break
-
-        # Paybill and Till specific fees
-        paybill_fee_patterns = [
-            r'paybill fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'till fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'merchant fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-        ]
-
-        for pattern in paybill_fee_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                fee = cls.extract_amount(match.group(1))
-                if fee is not None and fee > 0:
-                    fees['merchant_fee'] = fee
-                    break
-
-        # Interest charges (loans, overdrafts)
-        interest_patterns = [
-            r'interest[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'interest charge[d]?[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'loan interest[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-        ]
-
-        for pattern in interest_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                fee = cls.extract_amount(match.group(1))
-                if fee is not None and fee > 0:
-                    fees['interest_charge'] = fee
-                    break
-
-        # Late payment fees
-        late_fee_patterns = [
-            r'late fee[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'penalty[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-            r'late payment[:\s]*(?:ksh?|kes)?\s*([0-9,]+(?:\.[0-9]{1,2})?)',
-        ]
-
-        for pattern in late_fee_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                fee = cls.extract_amount(match.group(1))
-                if fee is not None and fee > 0:
-                    fees['late_fee'] = fee
-                    break
-
-        # Remove zero-value fees to avoid clutter (except transaction_fee which is important for tracking)
-        fees = {k: v for k, v in fees.items() if v > 0 or k == 'transaction_fee'}
+        if message_lower is None:
+            message_lower = message.lower()
+
+        for fee_type, keep_zero, searches in _FEE_SEARCHES:
+            if skip_fee_types and fee_type in skip_fee_types:
+                continue
+            for prefix, pattern in searches:
+                if prefix not in message_lower:
+                    continue
+                match = pattern.search(message_lower)
+                if match:
+                    fee = cls.extract_amount(match.group(1))
+                    # Zero transaction fees are kept for tracking; other fees must be positive
+                    if fee is not None and (fee >= 0 if keep_zero else fee > 0):
+                        fees[fee_type] = fee
+                        break
 
         return fees
 
@@ -1175,13 +1389,18 @@ class MPesaParser:
     def _hash_message(cls, message: str) -> str:
         """
         Generate a hash of the message for duplicate detection
+
+        Kept as MD5 because stored transactions are matched on this value;
+        it is not used for security.
         """
-        return hashlib.md5(message.encode('utf-8')).hexdigest()
+        return hashlib.md5(message.encode('utf-8'), usedforsecurity=False).hexdigest()
 
     @classmethod
-    def test_enhanced_parsing(cls) -> Dict[str, Any]:
+    def test_enhanced_parsing(cls, verbose: bool = True) -> Dict[str, Any]:
         """
         Test the enhanced parsing with the provided user examples
+
+        Pass verbose=False to only collect the results, without printing.
         """
         test_messages = [
             "TJ3CF6GKC7 Confirmed.You have received Ksh100.00 from Equity Bulk Account 300600 on 3/10/25 at 10:55 PM New M-PESA balance is Ksh111.86.  Separate personal and business funds through Pochi la Biashara on *334#.",
@@ -1191,8 +1410,9 @@ class MPesaParser:
 
         results = []
         for i, message in enumerate(test_messages, 1):
-            print(f"\n=== Testing Message {i} ===")
-            print(f"Original: {message[:100]}...")
+            if verbose:
+                print(f"\n=== Testing Message {i} ===")
+                print(f"Original: {message[:100]}...")
 
             parsed = cls.parse_message(message)
             if parsed:
@@ -1213,25 +1433,27 @@ class MPesaParser:
                     'requires_review': parsed['requires_review']
                 })
 
-                print(f"✅ SUCCESS")
-                print(f"Amount: KSh {parsed['amount']}")
-                print(f"Type: {parsed['type']}")
-                print(f"Description: {parsed['description']}")
-                print(f"Category: {parsed['suggested_category']}")
-                print(f"Date: {parsed.get('transaction_date', 'Not extracted')}")
-                print(f"Recipient: {parsed['mpesa_details']['recipient']}")
-                print(f"Transaction ID: {parsed['mpesa_details']['transaction_id']}")
-                print(f"Reference: {parsed['mpesa_details']['reference']}")
-                print(f"Balance After: {parsed['mpesa_details']['balance_after']}")
-                print(f"Transaction Fee: {parsed['mpesa_details']['transaction_fee']}")
-                print(f"Confidence: {parsed['parsing_confidence']:.2f}")
+                if verbose:
+                    print(f"✅ SUCCESS")
+                    print(f"Amount: KSh {parsed['amount']}")
+                    print(f"Type: {parsed['type']}")
+                    print(f"Description: {parsed['description']}")
+                    print(f"Category: {parsed['suggested_category']}")
+                    print(f"Date: {parsed.get('transaction_date', 'Not extracted')}")
+                    print(f"Recipient: {parsed['mpesa_details']['recipient']}")
+                    print(f"Transaction ID: {parsed['mpesa_details']['transaction_id']}")
+                    print(f"Reference: {parsed['mpesa_details']['reference']}")
+                    print(f"Balance After: {parsed['mpesa_details']['balance_after']}")
+                    print(f"Transaction Fee: {parsed['mpesa_details']['transaction_fee']}")
+                    print(f"Confidence: {parsed['parsing_confidence']:.2f}")
             else:
                 results.append({
                     'message_number': i,
                     'success': False,
                     'error': 'Failed to parse message'
                 })
-                print(f"❌ FAILED to parse message")
+                if verbose:
+                    print(f"❌ FAILED to parse message")
 
         return {
             'total_tested': len(test_messages),
@@ -1270,14 +1492,14 @@ class MPesaParser:
 
         # Use extracted transaction date if available, otherwise use current time
         transaction_date = parsed_data.get('transaction_date')
+        date = None
         if transaction_date:
             try:
                 # Parse the ISO date string
-                from datetime import datetime
                 date = datetime.fromisoformat(transaction_date)
             except (ValueError, TypeError):
-                date = datetime.now()
-        else:
+                pass
+        if date is None:
             date = datetime.now()
 
         return TransactionCreate(